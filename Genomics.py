@@ -3,9 +3,18 @@ import sys
 import subprocess
 import glob
 import re
+import csv
 import multiprocessing
+import sqlite3
+import time
 from math import floor 
 
+from work_queue import map_on_queue
+from annotation_store import build_annotation_store, genes_for_ko, best_hit
+from pipeline_metrics import register_tasks, reset_status, report_status, start_metrics_server
+from task_planner import (record_runtime, load_history, RuntimeModel,
+                          predict_tasks, plan_longest_first, print_plan)
+
 # ==============================================================================
 # --- CONFIGURATION ---
 # --- แก้ไขค่าต่างๆ ในส่วนนี้ให้ตรงกับโปรเจกต์ของคุณ ---
@@ -54,6 +63,36 @@ DIAMOND_DB_PATH = "/path/to/your/database.dmnd"
 # 7. ตั้งค่า EGGNoG
 EGGNOG_DATA_DIR = "/path/to/eggnog-mapper/data"
 
+# 8. ฐานข้อมูล Annotation รวม (SQLite) สร้างหลังจบ Pipeline จากผล DIAMOND + EggNOG ของทุกสปีชีส์
+ANNOTATION_DB_PATH = os.path.join(RESULT_BASE_DIR, "annotations.sqlite")
+
+# 9. การรันหลายเครื่อง (Multi-node)
+# "pool"  = ใช้ multiprocessing.Pool บนเครื่องนี้เครื่องเดียว (แบบเดิม)
+# "queue" = ส่งงานเข้าคิวบน shared storage ให้ worker ทุกเครื่องดึงไปทำ
+#           เครื่องอื่นรัน: python work_queue.py --db <WORK_QUEUE_DB> --queue genomics
+EXECUTION_BACKEND = "pool"
+WORK_QUEUE_DB = os.path.join(RESULT_BASE_DIR, "work_queue.sqlite")
+LOCAL_QUEUE_WORKERS = PARALLEL_JOBS  # จำนวน worker บนเครื่องที่ส่งงาน (0 = ให้เครื่องอื่นทำทั้งหมด)
+
+# 10. การจัดลำดับงาน
+# "longest_first" = ประมาณเวลาจากขนาด genome + เวลาที่เคยรันจริง แล้วส่งสปีชีส์ที่นานที่สุดก่อน
+# "input_order"   = ตามลำดับ os.listdir (แบบเดิม)
+SCHEDULING = "longest_first"
+RUNTIME_HISTORY_DB = os.path.join(RESULT_BASE_DIR, "00_Logs", "runtime_history.sqlite")
+DRY_RUN = False  # True = พิมพ์แผน, เวลาที่คาดว่าจะเสร็จ และการใช้งานแต่ละ slot แล้วออกโดยไม่รันงาน
+
+# 11. โหมดของ BUSCO
+# "genome"   = busco -m genome บนไฟล์ genome (Step 3, แบบเดิม) ทำ gene prediction เองซ้ำกับ AUGUSTUS ใช้กับรายงานสุดท้าย
+# "proteins" = busco -m proteins บน *_proteins.faa ที่ได้จาก AUGUSTUS (Step 4.6 หลังสกัดโปรตีน) เร็วกว่ามาก
+# "both"     = รันทั้งสองแบบ เพื่อเปรียบเทียบผลและเวลาใน BUSCO_mode_comparison.csv
+BUSCO_MODE = "genome"
+BUSCO_PROTEIN_OUTPUT_DIR = os.path.join(RESULT_BASE_DIR, "BUSCO_protein_results")
+
+# 12. Metrics endpoint (Prometheus text format) สำหรับดูความคืบหน้าระหว่างรัน
+# ดูได้ที่ http://localhost:<METRICS_PORT>/metrics (None = ปิด)
+METRICS_PORT = 9108
+STATUS_DIR = os.path.join(RESULT_BASE_DIR, "00_Logs", "status")
+
 # ==============================================================================
 # --- SCRIPT LOGIC ---
 # --- ไม่จำเป็นต้องแก้ไขโค้ดด้านล่างนี้ ---
@@ -155,6 +194,69 @@ def extract_seq(gff_file, protein_out,cds_out):
         print(f"  [ERROR] Could not process file {gff_file}: {e}\n")
         return False
     
+def run_busco(input_file, mode, out_path, species_name, busco_lineage, cpus, log_file, augustus_model=None):
+    """รัน BUSCO 1 โหมด แล้วบันทึกเวลาที่ใช้ไว้ในโฟลเดอร์ผลลัพธ์ (ใช้เทียบ genome vs proteins)"""
+    command = [
+        "busco",
+        "-i", input_file,
+        "-o", species_name,
+        "-l", busco_lineage,
+        "-m", mode,
+        "-c", str(cpus),
+        "--out_path", out_path,
+    ]
+    if augustus_model is not None:
+        command += ["--augustus_species", augustus_model]
+    command.append("--force")
+
+    start_time = time.time()
+    run_command(command, log_file)
+    with open(os.path.join(out_path, species_name, "busco_runtime_seconds.txt"), 'w') as f:
+        f.write(f"{time.time() - start_time:.1f}\n")
+
+def parse_busco_summary(busco_species_dir):
+    """อ่าน short_summary*.txt ของ BUSCO คืนค่า dict ของ C/S/D/F/M/n หรือ None ถ้าไม่มี"""
+    summary_files = glob.glob(os.path.join(busco_species_dir, "short_summary*.txt"))
+    if not summary_files:
+        return None
+    with open(summary_files[0], 'r') as f:
+        content = f.read()
+    match = re.search(r'C:([\d.]+)%\[S:([\d.]+)%,D:([\d.]+)%\],F:([\d.]+)%,M:([\d.]+)%,n:(\d+)', content)
+    if not match:
+        return None
+    keys = ("Complete", "Single", "Duplicated", "Fragmented", "Missing", "n")
+    return dict(zip(keys, match.groups()))
+
+def collect_busco_summaries(species_list, config):
+    """รวมผล BUSCO ทั้งโหมด genome และ proteins ของทุกสปีชีส์ เป็น BUSCO_mode_comparison.csv"""
+    out_file = os.path.join(config["RESULT_BASE_DIR"], "BUSCO_mode_comparison.csv")
+    rows = []
+    for species_name in species_list:
+        for mode, busco_dir in (("genome", config["BUSCO_OUTPUT_DIR"]),
+                                ("proteins", config["BUSCO_PROTEIN_OUTPUT_DIR"])):
+            busco_species_dir = os.path.join(busco_dir, species_name)
+            summary = parse_busco_summary(busco_species_dir)
+            if summary is None:
+                continue
+            runtime_file = os.path.join(busco_species_dir, "busco_runtime_seconds.txt")
+            seconds = ""
+            if os.path.exists(runtime_file):
+                with open(runtime_file, 'r') as f:
+                    seconds = f.read().strip()
+            rows.append([species_name, mode] + list(summary.values()) + [seconds])
+
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Species", "Mode", "Complete", "Single", "Duplicated",
+                         "Fragmented", "Missing", "n", "Runtime_seconds"])
+        writer.writerows(rows)
+    print(f"BUSCO summaries collected: {out_file} ({len(rows)} rows)")
+
+def report_species_step(config, species_name, step):
+    """อัปเดตขั้นตอนปัจจุบันของสปีชีส์ (แสดงใน metrics endpoint)"""
+    report_status(config["STATUS_DIR"], "genomics", "species", species_name, "running",
+                  step=step, threads=config["CPUS_PER_JOB"])
+
 def run_species_pipeline(species_name_config_tuple):
     """
     ฟังก์ชันนี้คือ Pipeline ทั้งหมดสำหรับ 1 สปีชีส์
@@ -185,6 +287,7 @@ def run_species_pipeline(species_name_config_tuple):
 
         # --- Step 1: Run QUAST ---
         print(f"  [{species_name}] Step 1: Running QUAST...")
+        report_species_step(config, species_name, "Step 1: QUAST")
         quast_output_path = os.path.join(config["QUAST_OUTPUT_DIR"], species_name)
         if not os.path.exists(os.path.join(quast_output_path, "report.txt")):
             os.makedirs(quast_output_path, exist_ok=True)
@@ -198,30 +301,22 @@ def run_species_pipeline(species_name_config_tuple):
         else:
             print(f"  [{species_name}] QUAST output already exists. Skipping.")
 
-        # --- Step 3: Run BUSCO ---
-        print(f"  [{species_name}] Step 3: Running BUSCO...")
+        # --- Step 3: Run BUSCO (genome mode) ---
         if species_name not in config["BUSCO_LINEAGE_MAP"]:
             print(f"  [WARNING] No BUSCO lineage defined for '{species_name}'. Skipping BUSCO.")
+        elif config["BUSCO_MODE"] not in ("genome", "both"):
+            print(f"  [{species_name}] BUSCO_MODE is '{config['BUSCO_MODE']}'. Genome mode skipped (proteins mode runs at Step 4.6).")
         else:
+            print(f"  [{species_name}] Step 3: Running BUSCO...")
+            report_species_step(config, species_name, "Step 3: BUSCO (genome)")
             busco_lineage = config["BUSCO_LINEAGE_MAP"][species_name]
             augustus_model = config["AUGUSTUS_SPECIES_MAP"].get(species_name, "generic")
-            busco_output_name = species_name
-            
-            command = [
-                "busco",
-                "-i", genome_file,
-                "-o", busco_output_name,
-                "-l", busco_lineage,
-                "-m", "genome",
-                "-c", str(cpus_per_job),
-                "--out_path", config["BUSCO_OUTPUT_DIR"],
-                "--augustus_species", augustus_model,
-                "--force"
-            ]
-            run_command(command, main_log_file)
+            run_busco(genome_file, "genome", config["BUSCO_OUTPUT_DIR"], species_name,
+                      busco_lineage, cpus_per_job, main_log_file, augustus_model=augustus_model)
 
         # --- Step 4: Run AUGUSTUS ---
         print(f"  [{species_name}] Step 4: Running AUGUSTUS...")
+        report_species_step(config, species_name, "Step 4: AUGUSTUS")
         if species_name not in config["AUGUSTUS_SPECIES_MAP"]:
             print(f"  [WARNING] No AUGUSTUS species model defined for '{species_name}'. Skipping AUGUSTUS.")
             return (species_name, "Skipped - No AUGUSTUS map")
@@ -244,6 +339,7 @@ def run_species_pipeline(species_name_config_tuple):
 
         # --- Step 4.5: Extracting Protein Seq. ---
         print(f"  [{species_name}] Step 4.5: Extracting Sequences...")
+        report_species_step(config, species_name, "Step 4.5: Extract sequences")
         protein_output_file = os.path.join(config["PROTEIN_OUTPUT_DIR"], f"{species_name}_proteins.faa")
         cds_output_file = os.path.join(config["CDS_OUTPUT_DIR"], f"{species_name}_cds.fna")
         
@@ -253,8 +349,20 @@ def run_species_pipeline(species_name_config_tuple):
             
         extract_seq(augustus_output_file, protein_output_file, cds_output_file)
 
+        # --- Step 4.6: Run BUSCO (proteins mode) ---
+        # ใช้โปรตีนจาก AUGUSTUS โดยตรง ไม่ต้องทำ gene prediction ซ้ำ
+        if config["BUSCO_MODE"] in ("proteins", "both") and species_name in config["BUSCO_LINEAGE_MAP"]:
+            print(f"  [{species_name}] Step 4.6: Running BUSCO (proteins mode)...")
+            report_species_step(config, species_name, "Step 4.6: BUSCO (proteins)")
+            if not os.path.exists(protein_output_file) or os.path.getsize(protein_output_file) == 0:
+                print(f"  [WARNING] Protein file not found or empty for '{species_name}'. Skipping BUSCO proteins mode.")
+            else:
+                run_busco(protein_output_file, "proteins", config["BUSCO_PROTEIN_OUTPUT_DIR"], species_name,
+                          config["BUSCO_LINEAGE_MAP"][species_name], cpus_per_job, main_log_file)
+
         # --- Step 5: Run DIAMOND ---
         print(f"  [{species_name}] Step 5: Running DIAMOND...")
+        report_species_step(config, species_name, "Step 5: DIAMOND")
         if not os.path.exists(protein_output_file) or os.path.getsize(protein_output_file) == 0:
             print(f"  [WARNING] Protein file not found or empty for '{species_name}'. Skipping DIAMOND.")
         else:
@@ -276,6 +384,7 @@ def run_species_pipeline(species_name_config_tuple):
 
         # --- Step 6: Run EggNOG-mapper ---
         print(f"  [{species_name}] Step 6: Running EggNOG-mapper...")
+        report_species_step(config, species_name, "Step 6: EggNOG-mapper")
         if not os.path.exists(protein_output_file) or os.path.getsize(protein_output_file) == 0:
             print(f"  [WARNING] Protein file not found or empty for '{species_name}'. Skipping EggNOG.")
         else:
@@ -306,6 +415,26 @@ def run_species_pipeline(species_name_config_tuple):
             log.write(f"\n{error_msg}\n")
         return (species_name, f"Failed - {e}")
 
+def genome_input_bytes(base_dir, species_name):
+    """ขนาดไฟล์ genome (bytes) ใช้ประมาณเวลารันของสปีชีส์ (0 ถ้าไม่พบไฟล์)"""
+    genome_file = find_genome_file(os.path.join(base_dir, species_name))
+    return os.path.getsize(genome_file) if genome_file else 0
+
+def run_species_pipeline_timed(species_name_config_tuple):
+    """เรียก run_species_pipeline แล้วบันทึกเวลาที่ใช้ลง runtime history (ใช้วางแผนรอบถัดไป)"""
+    species_name, config = species_name_config_tuple
+    start_time = time.time()
+    result = run_species_pipeline(species_name_config_tuple)
+    try:
+        record_runtime(config["RUNTIME_HISTORY_DB"], "genomics", species_name,
+                       genome_input_bytes(config["BASE_DIR"], species_name),
+                       time.time() - start_time, result[1])
+    except Exception as e:
+        print(f"  [WARNING] Could not record runtime for {species_name}: {e}")
+    report_status(config["STATUS_DIR"], "genomics", "species", species_name,
+                  "done" if result[1] == "Success" else "failed")
+    return result
+
 def main():
     """ฟังก์ชันหลักในการรัน Pipeline"""
     print("Starting Parallel Genomics Analysis Pipeline...")
@@ -328,7 +457,7 @@ def main():
         # กรองเอาโฟลเดอร์ผลลัพธ์ออกไป
         output_folder_names = {
             os.path.basename(d) for d in 
-            [QUAST_OUTPUT_DIR, BUSCO_OUTPUT_DIR, AUGUSTUS_OUTPUT_DIR, 
+            [QUAST_OUTPUT_DIR, BUSCO_OUTPUT_DIR, BUSCO_PROTEIN_OUTPUT_DIR, AUGUSTUS_OUTPUT_DIR, 
              PROTEIN_OUTPUT_DIR, CDS_OUTPUT_DIR, DIAMOND_OUTPUT_DIR, 
              EGGNOG_OUTPUT_DIR, os.path.join(RESULT_BASE_DIR, "00_Logs")]
         }
@@ -356,6 +485,8 @@ def main():
         "RESULT_BASE_DIR": RESULT_BASE_DIR,
         "QUAST_OUTPUT_DIR": QUAST_OUTPUT_DIR,
         "BUSCO_OUTPUT_DIR": BUSCO_OUTPUT_DIR,
+        "BUSCO_PROTEIN_OUTPUT_DIR": BUSCO_PROTEIN_OUTPUT_DIR,
+        "BUSCO_MODE": BUSCO_MODE,
         "AUGUSTUS_OUTPUT_DIR": AUGUSTUS_OUTPUT_DIR,
         "PROTEIN_OUTPUT_DIR": PROTEIN_OUTPUT_DIR,
         "CDS_OUTPUT_DIR": CDS_OUTPUT_DIR,
@@ -365,6 +496,9 @@ def main():
         "AUGUSTUS_SPECIES_MAP": AUGUSTUS_SPECIES_MAP,
         "DIAMOND_DB_PATH": DIAMOND_DB_PATH,
         "EGGNOG_DATA_DIR": EGGNOG_DATA_DIR,
+        "ANNOTATION_DB_PATH": ANNOTATION_DB_PATH,
+        "RUNTIME_HISTORY_DB": RUNTIME_HISTORY_DB,
+        "STATUS_DIR": STATUS_DIR,
         "CPUS_PER_JOB": cpus_per_job
     }
 
@@ -373,16 +507,47 @@ def main():
     # แต่ละ tuple คือ (species_name, config)
     tasks_to_run = [(species_name, config) for species_name in species_list]
 
+    # --- 4.5 วางแผนลำดับงาน (Longest-Job-First) ---
+    # ประมาณเวลาของแต่ละสปีชีส์จากขนาด genome และเวลาที่เคยรัน แล้วส่งงานที่นานที่สุดก่อน
+    # เพื่อไม่ให้ genome ใหญ่ที่บังเอิญอยู่ท้ายลิสต์ทำให้ทั้ง batch ต้องรอ
+    genome_sizes = [genome_input_bytes(BASE_DIR, species_name) for species_name in species_list]
+    model = RuntimeModel(load_history(RUNTIME_HISTORY_DB, "genomics"))
+    planned = predict_tasks(species_list, tasks_to_run, genome_sizes, model)
+    if SCHEDULING == "longest_first":
+        planned = plan_longest_first(planned)
+        species_list = [p[0] for p in planned]
+        tasks_to_run = [p[1] for p in planned]
+
+    if DRY_RUN:
+        print_plan(f"Genomics ({SCHEDULING})", planned, PARALLEL_JOBS)
+        print("\nDRY_RUN = True: no tasks were started.")
+        return
+
+    # --- 4.6 เปิด Metrics endpoint ---
+    reset_status(STATUS_DIR, "genomics")
+    register_tasks(STATUS_DIR, "genomics", "species", species_list, cpus_per_job)
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT, STATUS_DIR, "genomics", [RESULT_BASE_DIR])
+        except OSError as e:
+            print(f"[WARNING] Could not start metrics endpoint on port {METRICS_PORT}: {e}")
+
     # --- 5. รัน Pool ---
     print("="*50)
     print(f"Starting Process Pool... (Processing {len(tasks_to_run)} tasks)")
     print("="*50)
 
-    # ใช้ with-statement เพื่อให้แน่ใจว่า pool จะถูกปิดอย่างถูกต้อง
-    with multiprocessing.Pool(processes=PARALLEL_JOBS) as pool:
-        # .map() จะส่ง task (tuple) ไปยัง 'run_species_pipeline' ทีละตัว
-        # และรอจนกว่าทุกอย่างจะเสร็จสิ้น
-        results = pool.map(run_species_pipeline, tasks_to_run)
+    if EXECUTION_BACKEND == "queue":
+        # ส่งงานเข้าคิวบน shared storage แล้วรอจน worker ทุกเครื่องทำเสร็จ
+        results = map_on_queue(WORK_QUEUE_DB, "genomics", "Genomics:run_species_pipeline_timed",
+                               species_list, tasks_to_run, local_workers=LOCAL_QUEUE_WORKERS)
+    else:
+        # ใช้ with-statement เพื่อให้แน่ใจว่า pool จะถูกปิดอย่างถูกต้อง
+        with multiprocessing.Pool(processes=PARALLEL_JOBS) as pool:
+            # .map() จะส่ง task (tuple) ไปยัง 'run_species_pipeline' ทีละตัว
+            # และรอจนกว่าทุกอย่างจะเสร็จสิ้น
+            # chunksize=1 เพื่อให้ worker หยิบงานตามลำดับที่วางแผนไว้ทีละงาน
+            results = pool.map(run_species_pipeline_timed, tasks_to_run, chunksize=1)
 
     # --- 6. สรุปผลลัพธ์ ---
     print("="*50)
@@ -402,16 +567,27 @@ def main():
     print(f"Total Species:   {len(results)}")
     print(f"Succeeded:       {success_count}")
     print(f"Failed/Skipped:  {failed_count}")
+
+    # --- 7. รวม Annotation ทุกสปีชีส์ลงฐานข้อมูล และรวมผล BUSCO ---
+    print("="*50)
+    try:
+        build_annotation_store(species_list, config)
+    except (sqlite3.Error, OSError) as e:
+        # ผลของทุกสปีชีส์ยังอยู่ครบ สร้างใหม่ภายหลังได้ด้วย annotation_store.py
+        print(f"[WARNING] Could not build annotation store: {e}")
+        print(f"  > Rebuild later: python annotation_store.py --result-dir {RESULT_BASE_DIR}")
+    collect_busco_summaries(species_list, config)
     print("Pipeline finished successfully!")
 
 
-# --- 7. Entry Point (สำคัญมากสำหรับ multiprocessing) ---
+# --- 8. Entry Point (สำคัญมากสำหรับ multiprocessing) ---
 if __name__ == "__main__":
     # สร้างไดเรกทอรีสำหรับเก็บผลลัพธ์ทั้งหมด *ก่อน* ที่จะเริ่ม
     # เพื่อป้องกันไม่ให้ processes หลายตัวพยายามสร้างพร้อมกัน
     print("Creating output directories...")
     os.makedirs(QUAST_OUTPUT_DIR, exist_ok=True)
     os.makedirs(BUSCO_OUTPUT_DIR, exist_ok=True)
+    os.makedirs(BUSCO_PROTEIN_OUTPUT_DIR, exist_ok=True)
     os.makedirs(AUGUSTUS_OUTPUT_DIR, exist_ok=True)
     os.makedirs(PROTEIN_OUTPUT_DIR, exist_ok=True)
     os.makedirs(CDS_OUTPUT_DIR, exist_ok=True)
@@ -4,6 +4,13 @@ import csv
 import multiprocessing
 import sys
 import shutil
+import time
+
+from work_queue import map_on_queue
+from fastq_qc import qc_fastq_file, stream_command_with_qc, write_summary
+from pipeline_metrics import register_tasks, reset_status, report_status, start_metrics_server
+from task_planner import (record_runtime, load_history, RuntimeModel,
+                          predict_tasks, plan_longest_first, print_plan)
 
 # ==============================================================================
 # 1. การตั้งค่าโปรเจกต์ (PROJECT SETUP)
@@ -20,6 +27,38 @@ REF_DIR = os.path.join(BASE_DIR, "reference_data")
 SAMPLE_SHEET_FILE = os.path.join(BASE_DIR, "samples.csv")
 ADAPTER_FILE_PATH = os.path.join(REF_DIR, "TruSeq3-SE.fa") 
 
+# --- การรันหลายเครื่อง (Multi-node) ---
+# "pool"  = ใช้ multiprocessing.Pool บนเครื่องนี้เครื่องเดียว (แบบเดิม)
+# "queue" = ส่งงานเข้าคิวบน shared storage ให้ worker ทุกเครื่องดึงไปทำ
+#           เครื่องอื่น (cd มาที่โฟลเดอร์โปรเจกต์นี้ก่อน) รัน:
+#           python work_queue.py --db <WORK_QUEUE_DB> --queue transcriptomics
+#           ทุกขั้นตอน (qc, align, quant) ใช้คิวเดียวกัน worker 1 ตัวต่อเครื่องจึงทำได้ทุกขั้นตอน
+EXECUTION_BACKEND = "pool"
+WORK_QUEUE_DB = os.path.join(OUTPUT_DIR, "work_queue.sqlite")
+LOCAL_QUEUE_WORKERS = NUM_PARALLEL_JOBS  # จำนวน worker บนเครื่องที่ส่งงาน (0 = ให้เครื่องอื่นทำทั้งหมด)
+
+# --- การจัดลำดับงาน ---
+# "longest_first" = ประมาณเวลาจากขนาดไฟล์ input + เวลาที่เคยรันจริง แล้วส่ง sample ที่นานที่สุดก่อน
+# "input_order"   = ตามลำดับใน samples.csv (แบบเดิม)
+# ขั้นตอน QC วางแผนก่อนดาวน์โหลด จึงต้องใช้ขนาดไฟล์ .sra จากคอลัมน์ "Bytes" ใน samples.csv
+# (คัดลอกจาก SraRunTable ของ SRA Run Selector) ถ้าไม่มีคอลัมน์นี้ งาน QC ของ sample ใหม่จะเรียงตาม samples.csv
+SCHEDULING = "longest_first"
+RUNTIME_HISTORY_DB = os.path.join(OUTPUT_DIR, "runtime_history.sqlite")
+DRY_RUN = False  # True = พิมพ์แผนของทุกขั้นตอน, เวลาที่คาดว่าจะเสร็จ แล้วออกโดยไม่รันงาน
+
+# --- เครื่องมือ QC ---
+# "builtin" = fastq_qc.py ทำ QC ระหว่างที่ fastq-dump เขียนไฟล์ (ไม่ต้องเปิด JVM และไม่อ่านไฟล์ซ้ำ)
+#             ผลลัพธ์: fastqc_raw/<SRA_ID>_qc.json
+# "fastqc"  = รัน FastQC แยกหลังดาวน์โหลด (แบบเดิม)
+# pipeline นี้เป็น single-end (Trimmomatic SE, STAR 1 ไฟล์) ทั้งสองโหมด: run ที่เป็น paired-end จะถูกรายงานเป็น QC_Failed
+QC_ENGINE = "builtin"
+QC_THREADS = 2
+
+# --- Metrics endpoint (Prometheus text format) สำหรับดูความคืบหน้าระหว่างรัน ---
+# ดูได้ที่ http://localhost:<METRICS_PORT>/metrics (None = ปิด)
+METRICS_PORT = 9109
+STATUS_DIR = os.path.join(OUTPUT_DIR, "status")
+
 # --- สร้าง Directories หลัก (สำหรับเก็บผลลัพธ์) ---
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 for subdir in ["sra", "fastq_raw", "fastqc_raw", "fastq_trimmed"]:
@@ -29,9 +68,22 @@ for subdir in ["sra", "fastq_raw", "fastqc_raw", "fastq_trimmed"]:
 # 2. ฟังก์ชันช่วยรันคำสั่ง (HELPER FUNCTION)
 # ==============================================================================
 
+# ขั้นตอนที่ worker process นี้กำลังทำอยู่ (ตั้งโดย run_stage_timed ใช้รายงานสถานะ)
+_current_stage = None
+
+# ขนาดไฟล์ .sra จากคอลัมน์ Bytes ใน samples.csv (sra_id -> bytes) ใช้วางแผน QC ก่อนดาวน์โหลด
+_sample_sra_bytes = {}
+
+def report_sample_step(sra_id, step):
+    """อัปเดตขั้นตอนปัจจุบันของ sample (แสดงใน metrics endpoint)"""
+    if _current_stage is not None:
+        report_status(STATUS_DIR, "transcriptomics", _current_stage, sra_id, "running",
+                      step=step, threads=STAGE_THREADS[_current_stage])
+
 def execute_command(command_list, description, sra_id):
     """ฟังก์ชันรันคำสั่งพร้อม Logging"""
     log_prefix = f"[{sra_id}]"
+    report_sample_step(sra_id, description)
     print(f"\n{log_prefix} 🚀 Starting: {description}...")
     print(f"{log_prefix}    Command: {' '.join(command_list)}")
 
@@ -40,7 +92,7 @@ def execute_command(command_list, description, sra_id):
         result = subprocess.run(command_list, check=True, text=True, 
                                 executable=None, capture_output=True, timeout=3600) # 1 hour timeout
         print(f"{log_prefix} ✅ Finished: {description} successfully.")
-        return
+        return result
     except subprocess.CalledProcessError as e:
         print(f"❌ ERROR in '{description}' for {sra_id}: {e}")
         # พิมพ์ 5 บรรทัดสุดท้ายของ Stderr เพื่อ Debug
@@ -50,6 +102,25 @@ def execute_command(command_list, description, sra_id):
         print(f"❌ TIMEOUT: '{description}' for {sra_id} took too long.")
         raise Exception(f"Timeout on {sra_id}")
 
+def is_paired_end(sra_file):
+    """
+    ดูจาก spot แรกของไฟล์ .sra: ถ้า --split-spot ได้ 2 read ที่ชื่อ spot เดียวกัน = paired-end
+    (fastq-dump -Z ที่ไม่ split จะต่อ mate ทั้งสองเป็น read เดียวยาว 2 เท่าโดยไม่มี error)
+    """
+    cmd = ["fastq-dump", "-X", "1", "--split-spot", "--skip-technical", "-Z", sra_file]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    headers = []
+    try:
+        for i, line in enumerate(process.stdout):
+            if i % 4 == 0:
+                headers.append(line.split()[0] if line.strip() else "")
+            if i >= 7:
+                break
+    finally:
+        process.kill()
+        process.wait()
+    return len(headers) == 2 and headers[0] == headers[1]
+
 # ==============================================================================
 # 3. ฟังก์ชัน "คนงาน" (WORKER FUNCTIONS) - รันแบบขนาน
 # ==============================================================================
@@ -68,6 +139,7 @@ def run_qc_step(job_tuple):
         
         raw_fastq = os.path.join(raw_fastq_path, f"{sra_id}.fastq")
         trimmed_fastq = os.path.join(trimmed_fastq_path, f"{sra_id}_trimmed.fastq")
+        qc_summary_file = os.path.join(raw_fastqc_path, f"{sra_id}_qc.json")
 
         # --- 2. Acquisition ---
         if not os.path.exists(raw_fastq):
@@ -77,13 +149,38 @@ def run_qc_step(job_tuple):
             
             if not os.path.exists(sra_file):
                  sra_file = os.path.join(sra_path, f"{sra_id}.sra")
+
+            if is_paired_end(sra_file):
+                raise ValueError(f"{sra_id} is paired-end; this pipeline (Trimmomatic SE, STAR) "
+                                 f"only supports single-end runs")
             
-            cmd_dump = ["fastq-dump", "--outdir", raw_fastq_path, "--split-files", sra_file]
-            execute_command(cmd_dump, "Converting to FASTQ", sra_id)
+            if QC_ENGINE == "builtin":
+                # fastq-dump -Z เขียน FASTQ ออก stdout -> เขียนเป็น raw_fastq และทำ QC ไปพร้อมกัน
+                # (single-end เท่านั้น ตรวจแล้วด้านบน ผลเหมือน <SRA_ID>_1.fastq ของ --split-files)
+                cmd_dump = ["fastq-dump", "-Z", sra_file]
+                print(f"\n[{sra_id}] 🚀 Starting: Converting to FASTQ + QC...")
+                report_sample_step(sra_id, "Converting to FASTQ + QC")
+                print(f"[{sra_id}]    Command: {' '.join(cmd_dump)} > {raw_fastq}")
+                summary = stream_command_with_qc(cmd_dump, raw_fastq, QC_THREADS)
+                write_summary(summary, qc_summary_file)
+                print(f"[{sra_id}] ✅ Finished: Converting to FASTQ + QC successfully.")
+            else:
+                cmd_dump = ["fastq-dump", "--outdir", raw_fastq_path, "--split-files", sra_file]
+                execute_command(cmd_dump, "Converting to FASTQ", sra_id)
+                # --split-files เขียน <SRA_ID>_1.fastq แม้เป็น single-end -> เปลี่ยนชื่อเป็น raw_fastq
+                os.replace(os.path.join(raw_fastq_path, f"{sra_id}_1.fastq"), raw_fastq)
         
         # --- 3. QC Check ---
-        cmd_fastqc = ["fastqc", raw_fastq, "-o", raw_fastqc_path]
-        execute_command(cmd_fastqc, "Running FastQC", sra_id)
+        if QC_ENGINE == "builtin":
+            # ถ้า FASTQ มีอยู่แล้ว (รันซ้ำ) แต่ยังไม่มีผล QC ค่อยอ่านไฟล์มาทำ QC
+            if not os.path.exists(qc_summary_file):
+                print(f"\n[{sra_id}] 🚀 Starting: Built-in QC...")
+                report_sample_step(sra_id, "Built-in QC")
+                write_summary(qc_fastq_file(raw_fastq, QC_THREADS), qc_summary_file)
+                print(f"[{sra_id}] ✅ Finished: Built-in QC successfully.")
+        else:
+            cmd_fastqc = ["fastqc", raw_fastq, "-o", raw_fastqc_path]
+            execute_command(cmd_fastqc, "Running FastQC", sra_id)
 
         # --- 4. QC Trim ---
         cmd_trim = [
@@ -219,6 +316,94 @@ def build_star_indices(unique_species):
         else:
             print("  [✓] Index already exists.")
 
+# ขั้นตอนที่รันแบบขนานได้ (ชื่อ -> ฟังก์ชันคนงาน)
+STAGE_FUNCTIONS = {
+    "qc": run_qc_step,
+    "align": run_align_step,
+    "quant": run_quantify_step,
+}
+
+# จำนวน CPU threads ที่แต่ละขั้นตอนได้รับ (trimmomatic -threads 2, STAR --runThreadN 4, htseq-count 1)
+STAGE_THREADS = {
+    "qc": 2,
+    "align": 4,
+    "quant": 1,
+}
+
+def sample_input_bytes(sra_id, species_name, stage):
+    """
+    ขนาดไฟล์ input ของ sample ในขั้นตอนนั้น (bytes) ใช้ประมาณเวลารัน (0 ถ้ายังไม่มีข้อมูล)
+    QC ใช้ขนาด .sra เสมอ (ไฟล์ที่ดาวน์โหลดแล้ว หรือคอลัมน์ Bytes ใน samples.csv) ให้ตรงกันทั้งตอนวางแผนและตอนบันทึก
+    """
+    raw = [os.path.join(OUTPUT_DIR, "fastq_raw", f"{sra_id}{suffix}.fastq") for suffix in ("", "_1", "_2")]
+    trimmed = [os.path.join(OUTPUT_DIR, "fastq_trimmed", f"{sra_id}_trimmed.fastq")]
+    sra = [os.path.join(OUTPUT_DIR, "sra", sra_id, f"{sra_id}.sra"),
+           os.path.join(OUTPUT_DIR, "sra", f"{sra_id}.sra")]
+    bam = [os.path.join(OUTPUT_DIR, species_name, "bam_files", f"{sra_id}_Aligned.sortedByCoord.out.bam")]
+
+    if stage == "qc":
+        size = sum(os.path.getsize(p) for p in sra if os.path.exists(p))
+        return size or _sample_sra_bytes.get(sra_id, 0)
+
+    # ใช้ไฟล์ที่ใกล้ขั้นตอนนั้นที่สุดที่มีอยู่
+    candidates = {
+        "align": [trimmed, raw, sra],
+        "quant": [bam, trimmed, raw],
+    }[stage]
+    for paths in candidates:
+        size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        if size > 0:
+            return size
+    return 0
+
+def run_stage_timed(stage_job):
+    """เรียกคนงานของขั้นตอนนั้น แล้วบันทึกเวลาที่ใช้ลง runtime history (ใช้วางแผนรอบถัดไป)"""
+    global _current_stage
+    stage, job_tuple = stage_job
+    sra_id, species_name = job_tuple
+    _current_stage = stage
+    report_sample_step(sra_id, "Starting")
+    start_time = time.time()
+    result = STAGE_FUNCTIONS[stage](job_tuple)
+    try:
+        record_runtime(RUNTIME_HISTORY_DB, f"transcriptomics_{stage}", sra_id,
+                       sample_input_bytes(sra_id, species_name, stage),
+                       time.time() - start_time, result[1])
+    except Exception as e:
+        print(f"[{sra_id}] [WARNING] Could not record runtime: {e}")
+    report_status(STATUS_DIR, "transcriptomics", stage, sra_id,
+                  "done" if "Success" in result[1] else "failed")
+    _current_stage = None
+    return result
+
+def plan_stage(stage, jobs):
+    """ประมาณเวลาของทุก sample ในขั้นตอนนั้น และเรียงแบบ longest-first ถ้าตั้งค่าไว้"""
+    sra_ids = [job[0] for job in jobs]
+    sizes = [sample_input_bytes(sra_id, species_name, stage) for sra_id, species_name in jobs]
+    model = RuntimeModel(load_history(RUNTIME_HISTORY_DB, f"transcriptomics_{stage}"))
+    planned = predict_tasks(sra_ids, jobs, sizes, model)
+    unsized = sum(1 for p in planned if p[2] == 0 and p[3] is None)
+    if SCHEDULING == "longest_first" and unsized:
+        print(f"[WARNING] {stage}: {unsized} samples have no input size or runtime history "
+              f"and keep their samples.csv order."
+              + (" Add a 'Bytes' column (from SraRunTable) to samples.csv to order QC before download."
+                 if stage == "qc" else ""))
+    if SCHEDULING == "longest_first":
+        planned = plan_longest_first(planned)
+    return planned
+
+def run_stage(pool, stage, jobs):
+    """รัน 1 ขั้นตอนแบบขนาน ด้วย Pool บนเครื่องนี้ หรือด้วยคิวงานบน shared storage"""
+    ordered_jobs = [p[1] for p in plan_stage(stage, jobs)]
+    stage_jobs = [(stage, job) for job in ordered_jobs]
+    if EXECUTION_BACKEND == "queue":
+        # task id = "<stage>:<SRA_ID>" เพื่อให้ทุกขั้นตอนอยู่ในคิวเดียวกันได้
+        task_ids = [f"{stage}:{job[0]}" for job in ordered_jobs]
+        return map_on_queue(WORK_QUEUE_DB, "transcriptomics", "Transcriptomics:run_stage_timed",
+                            task_ids, stage_jobs, local_workers=LOCAL_QUEUE_WORKERS)
+    # chunksize=1 เพื่อให้ worker หยิบงานตามลำดับที่วางแผนไว้ทีละงาน
+    return pool.map(run_stage_timed, stage_jobs, chunksize=1)
+
 def main():
     
     # 1. เตรียม "รายชื่องาน" (Job List)
@@ -234,6 +419,8 @@ def main():
             for row in reader:
                 jobs.append((row['sra_id'], row['species_name']))
                 unique_species.add(row['species_name'])
+                if (row.get('Bytes') or '').strip().isdigit():
+                    _sample_sra_bytes[row['sra_id']] = int(row['Bytes'])
     except FileNotFoundError:
         print(f"❌ ERROR: Sample sheet not found at {SAMPLE_SHEET_FILE}")
         sys.exit(1)
@@ -243,15 +430,33 @@ def main():
         sys.exit(1)
         
     print(f"Found {len(jobs)} total SRA samples to process across {len(unique_species)} species.")
+
+    if DRY_RUN:
+        # แผนของ align/quant ใช้ขนาดไฟล์ที่มีอยู่ตอนนี้ (จะแม่นขึ้นเมื่อรันจริงเพราะวางแผนใหม่ทุกขั้นตอน)
+        for stage in STAGE_FUNCTIONS:
+            print_plan(f"Transcriptomics {stage} ({SCHEDULING})", plan_stage(stage, jobs), NUM_PARALLEL_JOBS)
+        print("\nDRY_RUN = True: no tasks were started.")
+        return
+
+    # --- เปิด Metrics endpoint ---
+    reset_status(STATUS_DIR, "transcriptomics")
+    sra_ids = [job[0] for job in jobs]
+    for stage in STAGE_FUNCTIONS:
+        register_tasks(STATUS_DIR, "transcriptomics", stage, sra_ids, STAGE_THREADS[stage])
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT, STATUS_DIR, "transcriptomics", [OUTPUT_DIR])
+        except OSError as e:
+            print(f"[WARNING] Could not start metrics endpoint on port {METRICS_PORT}: {e}")
     
     # --- เริ่มต้น Pool ---
-    pool = multiprocessing.Pool(processes=NUM_PARALLEL_JOBS)
+    pool = multiprocessing.Pool(processes=NUM_PARALLEL_JOBS) if EXECUTION_BACKEND == "pool" else None
     
     # 2. ขั้นตอนที่ 1: QC (ขนาน)
     print("\n" + "="*70)
     print(f"STEP 1: Running QC (Parallel Jobs: {NUM_PARALLEL_JOBS})...")
     print("="*70)
-    qc_results = pool.map(run_qc_step, jobs)
+    qc_results = run_stage(pool, "qc", jobs)
     
     # 3. ขั้นตอนที่ 2: สร้าง Index (ลำดับ)
     build_star_indices(unique_species)
@@ -260,17 +465,18 @@ def main():
     print("\n" + "="*70)
     print(f"STEP 3: Running Alignment (Parallel Jobs: {NUM_PARALLEL_JOBS})...")
     print("="*70)
-    align_results = pool.map(run_align_step, jobs)
+    align_results = run_stage(pool, "align", jobs)
 
     # 5. ขั้นตอนที่ 4: Quantification (ขนาน)
     print("\n" + "="*70)
     print(f"STEP 4: Running Quantification (Parallel Jobs: {NUM_PARALLEL_JOBS})...")
     print("="*70)
-    quant_results = pool.map(run_quantify_step, jobs)
+    quant_results = run_stage(pool, "quant", jobs)
     
     # --- ปิด Pool ---
-    pool.close()
-    pool.join()
+    if pool is not None:
+        pool.close()
+        pool.join()
     
     # 6. สรุปผลลัพธ์
     print("\n" + "="*70)
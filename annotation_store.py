@@ -0,0 +1,211 @@
+import os
+import sys
+import sqlite3
+import argparse
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# --- รวมผล DIAMOND และ EggNOG ของทุกสปีชีส์ไว้ใน SQLite ไฟล์เดียว (annotations.sqlite) ---
+# ==============================================================================
+#
+# Genomics.py เรียก build_annotation_store หลังจบ Pipeline
+# สร้างใหม่จากผลที่มีอยู่แล้ว (ไม่ต้องรัน Pipeline ซ้ำ):
+#   python annotation_store.py --result-dir /home_sbi_cold/.../Genomics/result
+
+ANNOTATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS diamond_hits (
+    species TEXT NOT NULL, gene_id TEXT NOT NULL, subject_id TEXT, pident REAL,
+    length INTEGER, evalue REAL, bitscore REAL, stitle TEXT
+);
+CREATE TABLE IF NOT EXISTS eggnog (
+    species TEXT NOT NULL, gene_id TEXT NOT NULL, seed_ortholog TEXT, evalue REAL, score REAL,
+    cog_category TEXT, description TEXT, preferred_name TEXT, ec TEXT,
+    kegg_ko TEXT, kegg_pathway TEXT, pfams TEXT
+);
+CREATE TABLE IF NOT EXISTS gene_ko (
+    species TEXT NOT NULL, gene_id TEXT NOT NULL, ko TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_diamond_gene ON diamond_hits (gene_id, bitscore DESC);
+CREATE INDEX IF NOT EXISTS idx_diamond_species ON diamond_hits (species, gene_id);
+CREATE INDEX IF NOT EXISTS idx_eggnog_gene ON eggnog (gene_id);
+CREATE INDEX IF NOT EXISTS idx_eggnog_species ON eggnog (species, gene_id);
+CREATE INDEX IF NOT EXISTS idx_gene_ko_ko ON gene_ko (ko, species);
+CREATE INDEX IF NOT EXISTS idx_gene_ko_gene ON gene_ko (species, gene_id);
+"""
+
+def _empty_to_none(value):
+    """EggNOG ใช้ '-' แทนค่าว่าง"""
+    return None if value in ("", "-") else value
+
+def parse_ko_list(kegg_ko):
+    """แตกคอลัมน์ KEGG_ko ของ EggNOG เช่น 'ko:K00001,ko:K00002' -> ['K00001', 'K00002']"""
+    kos = []
+    for ko in kegg_ko.replace("ko:", "").split(','):
+        ko = ko.strip()
+        if ko and ko != '-':
+            kos.append(ko)
+    return kos
+
+def iter_emapper_rows(annotation_file):
+    """อ่านไฟล์ .emapper.annotations คืนค่าทีละแถว (เลขบรรทัด, list ของคอลัมน์ เติมให้ครบ 21 คอลัมน์)"""
+    with open(annotation_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if line.startswith('#') or not line.strip():
+                continue
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 12:
+                continue
+            yield line_no, cols + [""] * (21 - len(cols))
+
+def _warn_skipped(path, skipped):
+    if skipped:
+        print(f"  [WARNING] {path}: skipped {len(skipped)} malformed lines "
+              f"(first at line {skipped[0]})")
+
+def read_diamond_hits(diamond_file, species_name):
+    """อ่านไฟล์ *_diamond.tsv (outfmt 6: qseqid sseqid pident length evalue bitscore stitle)"""
+    skipped = []
+    with open(diamond_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 6:
+                if line.strip():
+                    skipped.append(line_no)
+                continue
+            stitle = cols[6] if len(cols) > 6 else None
+            try:
+                row = (species_name, cols[0], cols[1], float(cols[2]), int(cols[3]),
+                       float(cols[4]), float(cols[5]), stitle)
+            except ValueError:
+                # เช่น บรรทัดสุดท้ายที่เขียนไม่จบ ไม่ควรทำให้ทั้ง store ล้ม
+                skipped.append(line_no)
+                continue
+            yield row
+    _warn_skipped(diamond_file, skipped)
+
+def read_eggnog_annotations(annotation_file, species_name):
+    """อ่านไฟล์ .emapper.annotations คืนค่า (แถว eggnog, list ของ (species, gene_id, KO))"""
+    rows, gene_kos, skipped = [], [], []
+    for line_no, cols in iter_emapper_rows(annotation_file):
+        gene_id = cols[0].strip()
+        try:
+            evalue = float(cols[2]) if _empty_to_none(cols[2]) else None
+            score = float(cols[3]) if _empty_to_none(cols[3]) else None
+        except ValueError:
+            skipped.append(line_no)
+            continue
+        rows.append((species_name, gene_id, _empty_to_none(cols[1]), evalue, score,
+                     _empty_to_none(cols[6]), _empty_to_none(cols[7]), _empty_to_none(cols[8]),
+                     _empty_to_none(cols[10]), _empty_to_none(cols[11]),
+                     _empty_to_none(cols[12]), _empty_to_none(cols[20])))
+        # แตก KO list ไว้ล่วงหน้า (ko:K00001,ko:K00002 -> 2 แถว)
+        gene_kos.extend((species_name, gene_id, ko) for ko in parse_ko_list(cols[11]))
+    _warn_skipped(annotation_file, skipped)
+    return rows, gene_kos
+
+def build_annotation_store(species_list, config):
+    """
+    ขั้นตอนหลังจบ Pipeline: รวมผล DIAMOND และ EggNOG ของทุกสปีชีส์ไว้ใน SQLite ไฟล์เดียว
+    สปีชีส์ที่มีอยู่แล้วจะถูกลบและใส่ใหม่ (รันซ้ำได้)
+    """
+    db_path = config["ANNOTATION_DB_PATH"]
+    print(f"Building annotation store: {db_path}")
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(ANNOTATION_SCHEMA)
+        for species_name in species_list:
+            diamond_file = os.path.join(config["DIAMOND_OUTPUT_DIR"], species_name,
+                                        f"{species_name}_diamond.tsv")
+            eggnog_file = os.path.join(config["EGGNOG_OUTPUT_DIR"], species_name,
+                                       f"{species_name}.emapper.annotations")
+            with conn:
+                for table in ("diamond_hits", "eggnog", "gene_ko"):
+                    conn.execute(f"DELETE FROM {table} WHERE species = ?", (species_name,))
+
+                n_hits = n_genes = n_kos = 0
+                if os.path.exists(diamond_file):
+                    cursor = conn.executemany(
+                        "INSERT INTO diamond_hits VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        read_diamond_hits(diamond_file, species_name))
+                    n_hits = cursor.rowcount
+                if os.path.exists(eggnog_file):
+                    rows, gene_kos = read_eggnog_annotations(eggnog_file, species_name)
+                    conn.executemany(
+                        "INSERT INTO eggnog VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    conn.executemany("INSERT INTO gene_ko VALUES (?, ?, ?)", gene_kos)
+                    n_genes, n_kos = len(rows), len(gene_kos)
+            print(f"  - {species_name}: {n_hits} DIAMOND hits, {n_genes} EggNOG genes, {n_kos} gene-KO pairs")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+def has_species(db_path, species_name):
+    """True ถ้า store มี KO ของสปีชีส์นี้แล้ว"""
+    if not db_path or not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT 1 FROM gene_ko WHERE species = ? LIMIT 1",
+                            (species_name,)).fetchone() is not None
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+def genes_for_ko(db_path, ko, species_name=None):
+    """คืนค่า list ของ (species, gene_id) ที่มี KO นี้ (ทุกสปีชีส์ หรือเฉพาะสปีชีส์ที่ระบุ)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        if species_name is None:
+            cursor = conn.execute("SELECT species, gene_id FROM gene_ko WHERE ko = ?", (ko,))
+        else:
+            cursor = conn.execute("SELECT species, gene_id FROM gene_ko WHERE ko = ? AND species = ?",
+                                  (ko, species_name))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def best_hit(db_path, gene_id, species_name=None):
+    """คืนค่า DIAMOND hit ที่ bitscore สูงสุดของยีนนี้ (dict) หรือ None ถ้าไม่มี"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        if species_name is None:
+            cursor = conn.execute("SELECT * FROM diamond_hits WHERE gene_id = ? "
+                                  "ORDER BY bitscore DESC LIMIT 1", (gene_id,))
+        else:
+            cursor = conn.execute("SELECT * FROM diamond_hits WHERE species = ? AND gene_id = ? "
+                                  "ORDER BY bitscore DESC LIMIT 1", (species_name, gene_id))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def main():
+    """สร้าง/อัปเดต annotations.sqlite จากผล DIAMOND และ EggNOG ที่มีอยู่แล้ว"""
+    parser = argparse.ArgumentParser(description="Build the DIAMOND/EggNOG annotation store")
+    parser.add_argument("--result-dir", required=True, help="RESULT_BASE_DIR ของ Genomics.py")
+    parser.add_argument("--db", help="Path ของไฟล์ SQLite (ค่าเริ่มต้น <result-dir>/annotations.sqlite)")
+    parser.add_argument("--species", nargs="*", help="เฉพาะสปีชีส์ที่ระบุ (ค่าเริ่มต้น ทุกสปีชีส์ที่มีผล)")
+    args = parser.parse_args()
+
+    config = {
+        "ANNOTATION_DB_PATH": args.db or os.path.join(args.result_dir, "annotations.sqlite"),
+        "DIAMOND_OUTPUT_DIR": os.path.join(args.result_dir, "DIAMOND_results"),
+        "EGGNOG_OUTPUT_DIR": os.path.join(args.result_dir, "EGGNOG_results"),
+    }
+    species_list = args.species
+    if not species_list:
+        found = set()
+        for key in ("DIAMOND_OUTPUT_DIR", "EGGNOG_OUTPUT_DIR"):
+            if os.path.isdir(config[key]):
+                found.update(d for d in os.listdir(config[key])
+                             if os.path.isdir(os.path.join(config[key], d)))
+        species_list = sorted(found)
+    if not species_list:
+        print(f"[ERROR] No DIAMOND_results or EGGNOG_results found in {args.result_dir}")
+        sys.exit(1)
+    build_annotation_store(species_list, config)
+
+if __name__ == "__main__":
+    main()
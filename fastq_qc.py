@@ -0,0 +1,309 @@
+import os
+import sys
+import gzip
+import json
+import subprocess
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================================================================
+# --- CONFIGURATION ---
+# ==============================================================================
+
+# ขนาดข้อมูลที่อ่านต่อครั้ง และจำนวน thread ที่ใช้ประมวลผลต่อไฟล์
+CHUNK_BYTES = 8 * 1024 * 1024
+QC_THREADS = 2
+
+# Phred offset ของ quality (Illumina 1.8+ = 33)
+PHRED_OFFSET = 33
+MAX_PHRED = 93
+
+# 12-mer ของ adapter ที่ใช้ประมาณ Adapter Content (ชุดเดียวกับ FastQC)
+ADAPTERS = {
+    "Illumina Universal Adapter": "AGATCGGAAGAG",
+    "Illumina Small RNA 3' Adapter": "TGGAATTCTCGG",
+    "Nextera Transposase Sequence": "CTGTCTCTTATA",
+    "PolyA": "AAAAAAAAAAAA",
+}
+ADAPTER_KMER = 12
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# ==============================================================================
+
+# ตารางแปลงเบส -> 0..3 (อื่นๆ = 4 ถือว่าใช้ไม่ได้สำหรับ k-mer)
+_BASE_CODE = np.full(256, 4, dtype=np.int64)
+for _code, _base in enumerate(b"ACGT"):
+    _BASE_CODE[_base] = _code
+    _BASE_CODE[ord(chr(_base).lower())] = _code
+
+def _kmer_code(kmer):
+    code = 0
+    for base in kmer.encode():
+        code = code * 4 + int(_BASE_CODE[base])
+    return code
+
+_ADAPTER_CODES = {name: _kmer_code(seq) for name, seq in ADAPTERS.items()}
+
+def _pad_lines(lines, lengths):
+    """รวม list ของ bytes เป็น matrix (reads x ความยาวสูงสุด) เติมช่องว่างด้วย 0"""
+    max_len = int(lengths.max()) if len(lengths) else 0
+    mask = np.arange(max_len) < lengths[:, None]
+    matrix = np.zeros((len(lines), max_len), dtype=np.uint8)
+    matrix[mask] = np.frombuffer(b"".join(lines), dtype=np.uint8)
+    return matrix, mask
+
+def chunk_stats(records):
+    """
+    คำนวณสถิติของ record ชุดหนึ่ง (list ของบรรทัด ครบ 4 บรรทัดต่อ read) แบบ vectorized
+    คืนค่า dict ของ numpy array ที่นำมารวมกันด้วย merge_stats ได้
+    """
+    seqs = [line.rstrip(b"\r") for line in records[1::4]]
+    quals = [line.rstrip(b"\r") for line in records[3::4]]
+    lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    if not np.array_equal(lengths, np.fromiter(map(len, quals), dtype=np.int64, count=len(quals))):
+        raise ValueError("Malformed FASTQ: sequence and quality lengths differ")
+
+    seq, mask = _pad_lines(seqs, lengths)
+    qual, _ = _pad_lines(quals, lengths)
+    n_reads, max_len = seq.shape
+    positions = np.nonzero(mask)[1]
+
+    # --- คุณภาพต่อตำแหน่ง (histogram ของ Phred score ต่อตำแหน่ง) ---
+    phred = np.clip(qual[mask].astype(np.int64) - PHRED_OFFSET, 0, MAX_PHRED)
+    qual_hist = np.bincount(positions * (MAX_PHRED + 1) + phred,
+                            minlength=max_len * (MAX_PHRED + 1)).reshape(max_len, MAX_PHRED + 1)
+
+    # --- N ต่อตำแหน่ง ---
+    upper = seq & 0xDF  # ตัวพิมพ์เล็ก -> ใหญ่
+    is_n = (upper == ord("N")) & mask
+    n_count = is_n.sum(axis=0)
+
+    # --- GC ต่อ read ---
+    gc = ((upper == ord("G")) | (upper == ord("C"))).sum(axis=1)
+    called = mask.sum(axis=1) - is_n.sum(axis=1)
+    gc_percent = np.rint(100.0 * gc / np.maximum(called, 1)).astype(np.int64)
+    gc_hist = np.bincount(gc_percent[called > 0], minlength=101)
+
+    # --- Adapter: ตำแหน่งแรกที่เจอ 12-mer ของแต่ละ adapter ---
+    adapter_first = {}
+    n_windows = max_len - ADAPTER_KMER + 1
+    if n_windows > 0:
+        base_code = _BASE_CODE[seq]
+        invalid = np.concatenate([np.zeros((n_reads, 1), dtype=np.int64),
+                                  np.cumsum(base_code == 4, axis=1)], axis=1)
+        valid = (invalid[:, ADAPTER_KMER:] - invalid[:, :n_windows]) == 0
+        kmer = np.zeros((n_reads, n_windows), dtype=np.int64)
+        for offset in range(ADAPTER_KMER):
+            kmer = kmer * 4 + (base_code[:, offset:offset + n_windows] & 3)
+        for name, code in _ADAPTER_CODES.items():
+            hits = (kmer == code) & valid
+            has_hit = hits.any(axis=1)
+            adapter_first[name] = np.bincount(hits.argmax(axis=1)[has_hit], minlength=max_len)
+    else:
+        adapter_first = {name: np.zeros(max_len, dtype=np.int64) for name in ADAPTERS}
+
+    return {
+        "reads": n_reads,
+        "length_hist": np.bincount(lengths),
+        "qual_hist": qual_hist,
+        "base_count": mask.sum(axis=0),
+        "n_count": n_count,
+        "gc_hist": gc_hist,
+        "adapter_first": adapter_first,
+    }
+
+def _add_padded(a, b):
+    """บวก array ที่ความยาวแกนแรกไม่เท่ากัน (read ยาวไม่เท่ากันในแต่ละ chunk)"""
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[:len(b)] += b
+    return a
+
+def merge_stats(total, part):
+    """รวมสถิติของ chunk เข้ากับผลรวม"""
+    if total is None:
+        return part
+    return {
+        "reads": total["reads"] + part["reads"],
+        "length_hist": _add_padded(total["length_hist"], part["length_hist"]),
+        "qual_hist": _add_padded(total["qual_hist"], part["qual_hist"]),
+        "base_count": _add_padded(total["base_count"], part["base_count"]),
+        "n_count": _add_padded(total["n_count"], part["n_count"]),
+        "gc_hist": total["gc_hist"] + part["gc_hist"],
+        "adapter_first": {name: _add_padded(total["adapter_first"][name], part["adapter_first"][name])
+                          for name in ADAPTERS},
+    }
+
+def _percentile_from_hist(hist, fraction):
+    """ค่า percentile ของแต่ละตำแหน่งจาก histogram (แถว = ตำแหน่ง, คอลัมน์ = Phred)"""
+    cumulative = np.cumsum(hist, axis=1)
+    target = cumulative[:, -1:] * fraction
+    return (cumulative < target).sum(axis=1)
+
+class FastqQC:
+    """
+    ตัวเก็บสถิติ QC แบบ streaming: ป้อนข้อมูลดิบด้วย feed() ทีละ chunk (จากไฟล์หรือจาก pipe)
+    record ที่ครบจะถูกส่งไปคำนวณใน thread pool แล้วรวมผลตอน finish()
+    """
+
+    def __init__(self, n_threads=QC_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=n_threads)
+        self.max_pending = n_threads * 2
+        self.pending = []
+        self.carry = b""
+        self.stats = None
+
+    def _submit(self, records):
+        if not records:
+            return
+        self.pending.append(self.executor.submit(chunk_stats, records))
+        # จำกัดจำนวนงานค้างไม่ให้ใช้ RAM เกิน
+        while len(self.pending) > self.max_pending:
+            self.stats = merge_stats(self.stats, self.pending.pop(0).result())
+
+    def feed(self, data):
+        """ป้อนข้อมูล FASTQ ดิบ (bytes) ส่วนที่ยังไม่ครบ record จะถูกเก็บไว้รวมกับรอบถัดไป"""
+        lines = (self.carry + data).split(b"\n")
+        n_full = (len(lines) - 1) // 4 * 4
+        self.carry = b"\n".join(lines[n_full:])
+        self._submit(lines[:n_full])
+
+    def finish(self):
+        """รวมผลทั้งหมดและคืนค่า summary (dict ที่เขียนเป็น JSON ได้)"""
+        lines = self.carry.split(b"\n")
+        while lines and not lines[-1]:
+            lines.pop()
+        if len(lines) % 4:
+            raise ValueError("Malformed FASTQ: truncated record at end of input")
+        self._submit(lines)
+        self.carry = b""
+        for future in self.pending:
+            self.stats = merge_stats(self.stats, future.result())
+        self.pending = []
+        self.executor.shutdown()
+        return summarize(self.stats)
+
+def summarize(stats):
+    """แปลงสถิติดิบเป็น summary แบบกะทัดรัด"""
+    if stats is None or stats["reads"] == 0:
+        return {"total_reads": 0}
+
+    reads = int(stats["reads"])
+    length_hist = stats["length_hist"]
+    lengths = np.nonzero(length_hist)[0]
+    qual_hist = stats["qual_hist"]
+    base_count = stats["base_count"]
+    phred_values = np.arange(qual_hist.shape[1])
+    total_bases = int(base_count.sum())
+    mean_quality = (qual_hist * phred_values).sum(axis=1) / np.maximum(base_count, 1)
+    gc_hist = stats["gc_hist"]
+
+    return {
+        "total_reads": reads,
+        "total_bases": total_bases,
+        "read_length": {
+            "min": int(lengths.min()),
+            "max": int(lengths.max()),
+            "mean": round(float((length_hist * np.arange(len(length_hist))).sum() / reads), 2),
+        },
+        "length_histogram": {str(int(length)): int(length_hist[length]) for length in lengths},
+        "mean_quality": round(float((qual_hist * phred_values).sum() / total_bases), 2),
+        "percent_q30": round(float(qual_hist[:, 30:].sum() / total_bases * 100), 2),
+        "per_position_quality": {
+            "mean": np.round(mean_quality, 2).tolist(),
+            "p10": _percentile_from_hist(qual_hist, 0.10).tolist(),
+            "q25": _percentile_from_hist(qual_hist, 0.25).tolist(),
+            "median": _percentile_from_hist(qual_hist, 0.50).tolist(),
+            "q75": _percentile_from_hist(qual_hist, 0.75).tolist(),
+            "p90": _percentile_from_hist(qual_hist, 0.90).tolist(),
+        },
+        "gc_content": {
+            "mean": round(float((gc_hist * np.arange(101)).sum() / max(gc_hist.sum(), 1)), 2),
+            "histogram": gc_hist.tolist(),
+        },
+        "n_percent_per_position": np.round(stats["n_count"] / np.maximum(base_count, 1) * 100, 3).tolist(),
+        # % ของ read ที่เจอ adapter ที่ตำแหน่งนั้นหรือก่อนหน้า (แบบเดียวกับ FastQC)
+        "adapter_content_percent": {
+            name: np.round(np.cumsum(first) / reads * 100, 3).tolist()
+            for name, first in stats["adapter_first"].items()
+        },
+    }
+
+def _open_fastq(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+def qc_fastq_file(fastq_path, n_threads=QC_THREADS, chunk_bytes=CHUNK_BYTES):
+    """QC ไฟล์ FASTQ หรือ FASTQ.gz ที่มีอยู่แล้ว"""
+    qc = FastqQC(n_threads)
+    with _open_fastq(fastq_path) as f:
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            qc.feed(data)
+    summary = qc.finish()
+    summary["file"] = os.path.basename(fastq_path)
+    return summary
+
+def stream_command_with_qc(command_list, out_path, n_threads=QC_THREADS, chunk_bytes=CHUNK_BYTES):
+    """
+    รันคำสั่งที่เขียน FASTQ ออก stdout (เช่น fastq-dump -Z) แล้วเขียนลง out_path
+    พร้อมทำ QC ระหว่างทาง (tap) ไม่ต้องอ่านไฟล์ซ้ำอีกรอบ
+    """
+    qc = FastqQC(n_threads)
+    tmp_path = out_path + ".part"
+    # stderr เขียนลงไฟล์ชั่วคราว กัน pipe เต็มแล้วค้างระหว่างที่เราอ่าน stdout
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(command_list, stdout=subprocess.PIPE, stderr=stderr_file)
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                out.write(data)
+                qc.feed(data)
+        process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors="replace")
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command_list, stderr=stderr)
+        summary = qc.finish()
+    except Exception:
+        process.kill()
+        process.wait()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        stderr_file.close()
+    # เปลี่ยนชื่อหลังเสร็จเท่านั้น กันไฟล์ครึ่งๆ กลางๆ ถูกนับว่าดาวน์โหลดแล้ว
+    os.replace(tmp_path, out_path)
+    summary["file"] = os.path.basename(out_path)
+    return summary
+
+def write_summary(summary, out_json):
+    with open(out_json, "w", encoding="utf-8") as f:
+        json.dump(summary, f, separators=(",", ":"))
+
+def main():
+    """ใช้แบบ command line: python fastq_qc.py reads.fastq[.gz] [output.json]"""
+    if len(sys.argv) < 2:
+        print("Usage: python fastq_qc.py <reads.fastq[.gz]> [output.json]")
+        sys.exit(1)
+    fastq_path = sys.argv[1]
+    base = os.path.basename(fastq_path)
+    for ext in (".gz", ".fastq", ".fq"):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+    out_json = sys.argv[2] if len(sys.argv) > 2 else f"{base}_qc.json"
+    summary = qc_fastq_file(fastq_path)
+    write_summary(summary, out_json)
+    print(f"{fastq_path}: {summary['total_reads']} reads, mean Q {summary.get('mean_quality')}, "
+          f"GC {summary.get('gc_content', {}).get('mean')}% -> {out_json}")
+
+if __name__ == "__main__":
+    main()
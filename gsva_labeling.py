@@ -0,0 +1,252 @@
+import os
+import sys
+import csv
+import glob
+import math
+import numpy as np
+
+from annotation_store import iter_emapper_rows, parse_ko_list, has_species, genes_for_ko
+
+# ==============================================================================
+# --- CONFIGURATION ---
+# --- ค่าเดียวกับ config/config.R ที่ใช้กับ backend_pipeline.R ---
+# ==============================================================================
+
+# 1. สปีชีส์และ Path ของไฟล์ input
+SPECIES = "Haematococcus_pluvialis"
+ANNOTATION_FILE = "/path/to/EGGNOG_results/Haematococcus_pluvialis/Haematococcus_pluvialis.emapper.annotations"
+# annotations.sqlite จาก Genomics.py (ถ้ามีสปีชีส์นี้จะใช้แทนการอ่าน ANNOTATION_FILE ทั้งไฟล์)
+ANNOTATION_DB = "/path/to/result/annotations.sqlite"
+TPM_DIR = "/path/to/transcriptome_data/Haematococcus_pluvialis"
+
+# 2. โฟลเดอร์ผลลัพธ์ (จะสร้างโฟลเดอร์ย่อยตามชื่อสปีชีส์ให้)
+OUTPUT_GSVA = "/path/to/result_all/gsva"
+
+# 3. KO ที่ใช้เป็น gene set
+FATTY_KO = ["K10203", "K10251", "K00645", "K00208", "K01897"]           # ELOVL6, HSD17B12, fabD, fabI, ACSL
+ASTA_KO_ALL = ["K09836", "K15746", "K02293", "K15744", "K02291", "K06443"]  # crtW/BKT, crtZ, PDS, ZDS, crtB, lcyB
+ASTA_KO_LABEL = ["K15746", "K09836"]                                     # crtZ + crtW
+
+# 4. เกณฑ์ Z-score สำหรับแบ่ง High / Medium / Low
+Z_THRESHOLD = 1.0
+
+# 5. จำนวนค่าสูงสุด (ยีน x sample x sample) ที่คำนวณ kernel CDF ต่อรอบ (ลดลงถ้า RAM ไม่พอ)
+# 10 ล้านค่า = ~80 MB ต่อ array ชั่วคราว (float64) ใช้พร้อมกันราว 7 array
+KCDF_MAX_ELEMENTS = 10_000_000
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# ==============================================================================
+
+# ตาราง CDF ของ normal ที่คำนวณไว้ล่วงหน้า (แบบเดียวกับ kernel_estimation.c ของ GSVA)
+MAX_PRECOMPUTE = 10.0
+PRECOMPUTE_RESOLUTION = 10000
+_PRECOMPUTED_CDF = np.array([
+    0.5 * (1.0 + math.erf((i * MAX_PRECOMPUTE / PRECOMPUTE_RESOLUTION) / math.sqrt(2.0)))
+    for i in range(PRECOMPUTE_RESOLUTION + 1)
+])
+
+def load_annotation(annotation_file):
+    """อ่านไฟล์ .emapper.annotations แล้วคืนค่า dict: KO -> set ของ gene_id"""
+    ko_to_genes = {}
+    for _, cols in iter_emapper_rows(annotation_file):
+        gene_id = cols[0].strip()
+        for ko in parse_ko_list(cols[11]):
+            ko_to_genes.setdefault(ko, set()).add(gene_id)
+    return ko_to_genes
+
+def load_ko_genes(config, ko_list):
+    """
+    dict: KO -> set ของ gene_id เฉพาะ KO ที่ต้องใช้
+    ดึงจาก annotations.sqlite (index ตาม KO) ถ้ามีสปีชีส์นี้ ไม่เช่นนั้นอ่านไฟล์ .emapper.annotations
+    """
+    if has_species(config["ANNOTATION_DB"], config["SPECIES"]):
+        print(f"Reading KO annotation from {config['ANNOTATION_DB']}")
+        return {ko: {gene_id for _, gene_id in genes_for_ko(config["ANNOTATION_DB"], ko, config["SPECIES"])}
+                for ko in set(ko_list)}
+    print(f"Reading KO annotation from {config['ANNOTATION_FILE']}")
+    return load_annotation(config["ANNOTATION_FILE"])
+
+def genes_for_kos(ko_to_genes, ko_list):
+    """รวม gene_id ของทุก KO ใน ko_list (ไม่ซ้ำกัน)"""
+    genes = set()
+    for ko in ko_list:
+        genes.update(ko_to_genes.get(ko, ()))
+    return genes
+
+def load_tpm(tpm_dir):
+    """อ่านไฟล์ *rsem.genes.results ทั้งหมด คืนค่า (gene_ids, sample_names, TPM matrix genes x samples)"""
+    files = sorted(glob.glob(os.path.join(tpm_dir, "*rsem.genes.results")))
+    if not files:
+        raise FileNotFoundError(f"No TPM files found in {tpm_dir}")
+
+    gene_ids = None
+    sample_names = []
+    columns = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f, delimiter='\t')
+            ids, tpm = [], []
+            for row in reader:
+                ids.append(row['gene_id'])
+                tpm.append(float(row['TPM']))
+        if gene_ids is None:
+            gene_ids = ids
+        sample_names.append(os.path.basename(path).replace("_rsem.genes.results", ""))
+        columns.append(tpm)
+
+    return gene_ids, sample_names, np.array(columns, dtype=np.float64).T
+
+def prepare_expr(gene_ids, tpm_matrix):
+    """
+    log2(TPM + 1) แล้วกรองยีนที่ค่าเฉลี่ย <= 1 ออก (เหมือน prepare_expr ใน R)
+    และตัดยีนที่ค่าคงที่ทุก sample (sd = 0) แบบเดียวกับที่ gsva() ทำก่อนคำนวณ kernel CDF
+    """
+    expr = np.log2(tpm_matrix + 1.0)
+    keep = expr.mean(axis=1) > 1
+    constant = keep & (expr.std(axis=1) == 0)
+    if constant.any():
+        print(f"[WARNING] {int(constant.sum())} genes with constant values throughout the samples removed")
+    keep &= ~constant
+    return [g for g, k in zip(gene_ids, keep) if k], expr[keep]
+
+def _precomputed_cdf(v):
+    """ค่า Phi(v) จากตารางที่คำนวณไว้ (นอกช่วง ±MAX_PRECOMPUTE ปัดเป็น 0 หรือ 1)"""
+    idx = np.minimum((np.abs(v) / MAX_PRECOMPUTE * PRECOMPUTE_RESOLUTION).astype(np.int64),
+                     PRECOMPUTE_RESOLUTION)
+    cdf = _PRECOMPUTED_CDF[idx]
+    return np.where(v < 0, 1.0 - cdf, cdf)
+
+def gaussian_kcdf(expr, max_elements=KCDF_MAX_ELEMENTS):
+    """
+    ขั้นตอนที่ 1 ของ GSVA (kcdf="Gaussian"): ประมาณ CDF ของแต่ละยีนด้วย Gaussian kernel
+    แล้วแปลงเป็น log-odds คำนวณครั้งเดียวต่อ expression matrix แล้วใช้ร่วมกันทุก gene set
+    (expr ต้องไม่มียีนที่ค่าคงที่ ดู prepare_expr)
+    """
+    n_genes, n_samples = expr.shape
+    # array ชั่วคราวมีขนาด gene_chunk x n x n จึงกำหนดจำนวนยีนต่อรอบจากจำนวนค่า ไม่ใช่จำนวนยีนคงที่
+    gene_chunk = max(1, max_elements // (n_samples * n_samples))
+    density = np.empty_like(expr)
+    for start in range(0, n_genes, gene_chunk):
+        block = expr[start:start + gene_chunk]
+        bw = block.std(axis=1, ddof=1) / 4.0
+        # diff[g, j, k] = (x_gj - x_gk) / bw_g
+        diff = (block[:, :, None] - block[:, None, :]) / bw[:, None, None]
+        left_tail = _precomputed_cdf(diff).mean(axis=2)
+        density[start:start + gene_chunk] = -np.log((1.0 - left_tail) / left_tail)
+    return density
+
+def gsva_scores(expr, gene_ids, gene_sets, tau=1.0):
+    """
+    คำนวณคะแนน GSVA (method="gsva", kcdf="Gaussian", mx.diff=TRUE) ของหลาย gene set พร้อมกัน
+    gene_sets: dict ชื่อ -> iterable ของ gene_id
+    คืนค่า dict ชื่อ -> numpy array ของคะแนนต่อ sample
+    """
+    index = {g: i for i, g in enumerate(gene_ids)}
+    names = []
+    membership = np.zeros((len(gene_sets), len(gene_ids)), dtype=bool)
+    for row, (name, genes) in enumerate(gene_sets.items()):
+        names.append(name)
+        hits = [index[g] for g in genes if g in index]
+        membership[row, hits] = True
+
+    n_genes, n_samples = expr.shape
+    set_sizes = membership.sum(axis=1)
+    density = gaussian_kcdf(expr)
+
+    # rank score แบบสมมาตร: |p/2 - อันดับ| (อันดับ 1 = density สูงสุด)
+    rank_weight = np.abs(np.arange(n_genes, 0, -1) - n_genes / 2.0) ** tau
+
+    scores = np.zeros((len(names), n_samples))
+    for j in range(n_samples):
+        order = np.argsort(-density[:, j], kind='stable')
+        hit = membership[:, order]
+        hit_weight = np.where(hit, rank_weight, 0.0)
+        walk = (np.cumsum(hit_weight, axis=1) / hit_weight.sum(axis=1, keepdims=True)
+                - np.cumsum(~hit, axis=1) / (n_genes - set_sizes)[:, None])
+        scores[:, j] = np.maximum(walk.max(axis=1), 0) + np.minimum(walk.min(axis=1), 0)
+
+    return dict(zip(names, scores))
+
+def label_scores(label_score, z_threshold=Z_THRESHOLD):
+    """แปลงคะแนนเป็น Z-score แล้วแบ่งเป็น High / Medium / Low"""
+    z = (label_score - label_score.mean()) / label_score.std(ddof=1)
+    labels = np.where(z >= z_threshold, "High", np.where(z <= -z_threshold, "Low", "Medium"))
+    return z, labels
+
+def write_model_csv(model_name, sample_names, label_score, output_path):
+    """เขียนไฟล์ <model>_model.csv ในรูปแบบเดียวกับ run_model ใน backend_pipeline.R"""
+    z, labels = label_scores(label_score)
+    out_file = os.path.join(output_path, f"{model_name}_model.csv")
+    with open(out_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Sample", f"{model_name}_score", "Zscore", "Label"])
+        for sample, score, zscore, label in zip(sample_names, label_score, z, labels):
+            writer.writerow([sample, round(float(score), 4), round(float(zscore), 4), label])
+    print(f"  > {model_name} DONE: {out_file}")
+
+def run_models(expr, gene_ids, sample_names, models, output_path):
+    """
+    models: dict ชื่อโมเดล -> (feature_genes, label_genes)
+    รวมทุก gene set ของทุกโมเดลไว้ใน gsva_scores ครั้งเดียว
+    """
+    expressed = set(gene_ids)
+    gene_sets = {}
+    for model_name, (feature_genes, label_genes) in models.items():
+        feature_genes = expressed.intersection(feature_genes)
+        label_genes = expressed.intersection(label_genes)
+        if len(feature_genes) < 2:
+            raise ValueError(f"Not enough feature genes for {model_name}")
+        if len(label_genes) < 2:
+            raise ValueError(f"Not enough label genes for {model_name}")
+        gene_sets[f"{model_name}_feature"] = feature_genes
+        gene_sets[f"{model_name}_label"] = label_genes
+
+    scores = gsva_scores(expr, gene_ids, gene_sets)
+
+    for model_name in models:
+        write_model_csv(model_name, sample_names, scores[f"{model_name}_label"], output_path)
+
+def run_pipeline(config):
+    """ฟังก์ชันหลัก: ทำงานเหมือน run_pipeline ใน backend_pipeline.R"""
+    species_output = os.path.join(config["OUTPUT_GSVA"], config["SPECIES"])
+    os.makedirs(species_output, exist_ok=True)
+
+    # --- 1. LOAD ANNOTATION & MAP GENES ---
+    ko_to_genes = load_ko_genes(config, config["FATTY_KO"] + config["ASTA_KO_ALL"] + config["ASTA_KO_LABEL"])
+    fatty_genes = genes_for_kos(ko_to_genes, config["FATTY_KO"])
+    asta_genes = genes_for_kos(ko_to_genes, config["ASTA_KO_ALL"])
+    label_genes = genes_for_kos(ko_to_genes, config["ASTA_KO_LABEL"])
+
+    # --- 2. LOAD TPM & PREPARE EXPRESSION ---
+    gene_ids, sample_names, tpm_matrix = load_tpm(config["TPM_DIR"])
+    gene_ids, expr = prepare_expr(gene_ids, tpm_matrix)
+    print(f"Expression ready: {expr.shape[0]} genes x {expr.shape[1]} samples")
+
+    # --- 3. RUN MODELS ---
+    models = {
+        "PUFAs": (fatty_genes, fatty_genes),        # label = ทุก KO
+        "Astaxanthin": (asta_genes, label_genes),   # label = crtZ + crtW
+    }
+    run_models(expr, gene_ids, sample_names, models, species_output)
+    print("PIPELINE COMPLETED")
+
+def main():
+    config = {
+        "SPECIES": SPECIES,
+        "ANNOTATION_FILE": ANNOTATION_FILE,
+        "ANNOTATION_DB": ANNOTATION_DB,
+        "TPM_DIR": TPM_DIR,
+        "OUTPUT_GSVA": OUTPUT_GSVA,
+        "FATTY_KO": FATTY_KO,
+        "ASTA_KO_ALL": ASTA_KO_ALL,
+        "ASTA_KO_LABEL": ASTA_KO_LABEL,
+    }
+    try:
+        run_pipeline(config)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
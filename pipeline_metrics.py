@@ -0,0 +1,220 @@
+import os
+import json
+import glob
+import time
+import socket
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# --- สถานะงานแบบ real-time + HTTP endpoint รูปแบบ Prometheus text ---
+# ==============================================================================
+#
+# worker (ทุก process / ทุกเครื่อง) เขียนสถานะของงานเป็นไฟล์ JSON เล็กๆ ใน status_dir
+# ตัวหลักเปิด HTTP server อ่านไฟล์เหล่านี้ทุกครั้งที่ถูก scrape:
+#   curl http://localhost:9108/metrics
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def _status_file(status_dir, pipeline, stage, task):
+    return os.path.join(status_dir, f"{pipeline}__{stage}__{task}.json")
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def register_tasks(status_dir, pipeline, stage, task_ids, threads):
+    """ลงทะเบียนงานทั้งหมดของขั้นตอนเป็น queued (เรียกจากตัวหลักก่อนเริ่มรัน)"""
+    os.makedirs(status_dir, exist_ok=True)
+    now = time.time()
+    for task in task_ids:
+        _write_json_atomic(_status_file(status_dir, pipeline, stage, task), {
+            "pipeline": pipeline, "stage": stage, "task": task, "state": "queued",
+            "step": "", "step_started": now, "threads": threads, "host": "", "pid": None,
+        })
+
+def reset_status(status_dir, pipeline):
+    """ลบสถานะเก่าของ pipeline นี้ (จากการรันครั้งก่อน)"""
+    for path in glob.glob(os.path.join(status_dir, f"{pipeline}__*.json")):
+        os.remove(path)
+
+def report_status(status_dir, pipeline, stage, task, state, step=None, threads=None):
+    """
+    อัปเดตสถานะของงาน (เรียกจาก worker) state = running / done / failed
+    ถ้า step เปลี่ยน จะเริ่มนับเวลาของ step ใหม่
+    """
+    path = _status_file(status_dir, pipeline, stage, task)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        data = {"pipeline": pipeline, "stage": stage, "task": task, "step": "", "threads": threads}
+    now = time.time()
+    if step is not None and step != data.get("step"):
+        data["step"] = step
+        data["step_started"] = now
+    if threads is not None:
+        data["threads"] = threads
+    data.update({"state": state, "host": socket.gethostname(), "pid": os.getpid(), "updated": now})
+    try:
+        os.makedirs(status_dir, exist_ok=True)
+        _write_json_atomic(path, data)
+    except OSError as e:
+        # สถานะเป็นแค่ข้อมูลประกอบ ไม่ควรทำให้งานจริงล้ม
+        print(f"  [WARNING] Could not write status for {task}: {e}")
+
+def _read_process_table():
+    """อ่าน /proc/*/stat ครั้งเดียว คืนค่า (parent pid -> list ของ pid ลูก, pid -> เวลา CPU)"""
+    children = {}
+    cpu = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path, 'r') as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        pid = int(stat_path.split("/")[2])
+        children.setdefault(int(fields[1]), []).append(pid)
+        # utime, stime, cutime, cstime (cutime/cstime = ลูกที่จบและถูก wait แล้ว)
+        cpu[pid] = sum(int(v) for v in fields[11:15]) / _CLK_TCK
+    return children, cpu
+
+def _process_tree_cpu_seconds(root_pid, process_table):
+    """เวลา CPU (user+sys) ของ process และลูกหลานทั้งหมด (Linux เท่านั้น)"""
+    children, cpu = process_table
+    if root_pid not in cpu:
+        return None
+    total, stack = 0.0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += cpu.get(pid, 0.0)
+        stack.extend(children.get(pid, ()))
+    return total
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+class MetricsCollector:
+    """อ่านไฟล์สถานะทั้งหมดและแปลงเป็น Prometheus text format"""
+
+    def __init__(self, status_dir, pipeline, storage_paths):
+        self.status_dir = status_dir
+        self.pipeline = pipeline
+        self.storage_paths = storage_paths
+        self.started = time.time()
+        self.hostname = socket.gethostname()
+        self._cpu_samples = {}
+        self._lock = threading.Lock()
+
+    def _threads_used(self, status, now, process_table):
+        """จำนวน core ที่งานใช้จริงตั้งแต่ scrape ครั้งก่อน (เฉพาะงานบนเครื่องนี้)"""
+        if status.get("host") != self.hostname or not status.get("pid"):
+            return None
+        cpu_seconds = _process_tree_cpu_seconds(status["pid"], process_table)
+        if cpu_seconds is None:
+            return None
+        key = (status["stage"], status["task"], status["pid"])
+        with self._lock:
+            previous = self._cpu_samples.get(key)
+            self._cpu_samples[key] = (now, cpu_seconds)
+        if previous is None or now <= previous[0]:
+            return None
+        return max(0.0, (cpu_seconds - previous[1]) / (now - previous[0]))
+
+    def render(self):
+        now = time.time()
+        statuses = []
+        for path in glob.glob(os.path.join(self.status_dir, f"{self.pipeline}__*.json")):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    statuses.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue
+
+        lines = [
+            "# HELP pipeline_up Metrics endpoint is running.",
+            "# TYPE pipeline_up gauge",
+            f'pipeline_up{{pipeline="{self.pipeline}"}} 1',
+            "# HELP pipeline_start_time_seconds Unix time the pipeline started.",
+            "# TYPE pipeline_start_time_seconds gauge",
+            f'pipeline_start_time_seconds{{pipeline="{self.pipeline}"}} {self.started:.0f}',
+            "# HELP pipeline_tasks Number of tasks per stage and state.",
+            "# TYPE pipeline_tasks gauge",
+        ]
+        counts = {}
+        for status in statuses:
+            key = (status["stage"], status.get("state", "queued"))
+            counts[key] = counts.get(key, 0) + 1
+        for stage in sorted({s["stage"] for s in statuses}):
+            for state in ("queued", "running", "done", "failed"):
+                lines.append(f'pipeline_tasks{{pipeline="{self.pipeline}",stage="{_escape(stage)}",'
+                             f'state="{state}"}} {counts.get((stage, state), 0)}')
+
+        running = [s for s in statuses if s.get("state") == "running"]
+        # อ่าน /proc ครั้งเดียวต่อการ scrape แล้วใช้ร่วมกันทุกงาน
+        process_table = (_read_process_table()
+                         if any(s.get("host") == self.hostname for s in running) else ({}, {}))
+        step_info, step_seconds, allocated, used = [], [], [], []
+        for status in sorted(running, key=lambda s: (s["stage"], s["task"])):
+            labels = (f'pipeline="{self.pipeline}",stage="{_escape(status["stage"])}",'
+                      f'task="{_escape(status["task"])}"')
+            step_info.append(f'pipeline_task_step_info{{{labels},step="{_escape(status.get("step", ""))}",'
+                             f'host="{_escape(status.get("host", ""))}"}} 1')
+            step_seconds.append(f'pipeline_task_step_seconds{{{labels}}} {now - status.get("step_started", now):.0f}')
+            if status.get("threads") is not None:
+                allocated.append(f'pipeline_task_threads_allocated{{{labels}}} {status["threads"]}')
+            threads_used = self._threads_used(status, now, process_table)
+            if threads_used is not None:
+                used.append(f'pipeline_task_threads_used{{{labels}}} {threads_used:.2f}')
+
+        lines += ["# HELP pipeline_task_step_info Current step of each running task.",
+                  "# TYPE pipeline_task_step_info gauge"] + step_info
+        lines += ["# HELP pipeline_task_step_seconds Seconds spent in the current step.",
+                  "# TYPE pipeline_task_step_seconds gauge"] + step_seconds
+        lines += ["# HELP pipeline_task_threads_allocated CPU threads allocated to the task.",
+                  "# TYPE pipeline_task_threads_allocated gauge"] + allocated
+        lines += ["# HELP pipeline_task_threads_used CPU cores used by the task since the last scrape (local tasks only).",
+                  "# TYPE pipeline_task_threads_used gauge"] + used
+
+        lines += ["# HELP pipeline_storage_free_bytes Free space on the output mount.",
+                  "# TYPE pipeline_storage_free_bytes gauge"]
+        totals = []
+        for path in self.storage_paths:
+            try:
+                usage = shutil.disk_usage(path)
+            except OSError:
+                continue
+            lines.append(f'pipeline_storage_free_bytes{{path="{_escape(path)}"}} {usage.free}')
+            totals.append(f'pipeline_storage_total_bytes{{path="{_escape(path)}"}} {usage.total}')
+        lines += ["# HELP pipeline_storage_total_bytes Size of the output mount.",
+                  "# TYPE pipeline_storage_total_bytes gauge"] + totals
+        return "\n".join(lines) + "\n"
+
+def start_metrics_server(port, status_dir, pipeline, storage_paths, host="127.0.0.1"):
+    """เปิด HTTP server (daemon thread) ที่ http://host:port/metrics คืนค่า server"""
+    collector = MetricsCollector(status_dir, pipeline, storage_paths)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = collector.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # ไม่พิมพ์ทุก request ปนกับ log ของ pipeline
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return server
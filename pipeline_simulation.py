@@ -0,0 +1,570 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import subprocess
+import multiprocessing
+
+# ==============================================================================
+# --- CONFIGURATION ---
+# --- โปรไฟล์ของเครื่องมือจำลอง (stub) ---
+# ==============================================================================
+#
+# เวลา wall ของแต่ละเครื่องมือ = (base_seconds + seconds_per_mb * ขนาด input เป็น MB) * SIM_TIME_SCALE
+# ระหว่างนั้นจะใช้ CPU เต็ม thread ที่ได้รับเป็นสัดส่วน cpu_fraction ของเวลา ที่เหลือคือรอ (I/O, network)
+# output_ratio = ขนาด output เทียบกับขนาด input
+TOOL_PROFILES = {
+    "quast.py":     {"base_seconds": 5,   "seconds_per_mb": 0.5,  "cpu_fraction": 0.8, "output_ratio": 0.001},
+    "busco":        {"base_seconds": 60,  "seconds_per_mb": 20.0, "cpu_fraction": 0.9, "output_ratio": 0.01},
+    "augustus":     {"base_seconds": 30,  "seconds_per_mb": 60.0, "cpu_fraction": 1.0, "output_ratio": 0.5},
+    "diamond":      {"base_seconds": 20,  "seconds_per_mb": 30.0, "cpu_fraction": 0.9, "output_ratio": 0.05},
+    "emapper.py":   {"base_seconds": 60,  "seconds_per_mb": 40.0, "cpu_fraction": 0.7, "output_ratio": 0.2},
+    "prefetch":     {"base_seconds": 10,  "seconds_per_mb": 0.5,  "cpu_fraction": 0.1, "output_ratio": 1.0},
+    "fastq-dump":   {"base_seconds": 5,   "seconds_per_mb": 0.3,  "cpu_fraction": 0.9, "output_ratio": 4.0},
+    "fastqc":       {"base_seconds": 8,   "seconds_per_mb": 0.1,  "cpu_fraction": 1.0, "output_ratio": 0.001},
+    "trimmomatic":  {"base_seconds": 5,   "seconds_per_mb": 0.2,  "cpu_fraction": 0.9, "output_ratio": 0.9},
+    "STAR":         {"base_seconds": 10,  "seconds_per_mb": 0.4,  "cpu_fraction": 0.9, "output_ratio": 0.3},
+    "htseq-count":  {"base_seconds": 5,   "seconds_per_mb": 0.8,  "cpu_fraction": 1.0, "output_ratio": 0.0},
+}
+
+# ช่วงของ pipeline ที่เครื่องมือแต่ละตัวรันอยู่ (ใช้คำนวณเวลาขั้นต่ำ)
+# ช่วงใน PARALLEL_PHASES รันใน slot ของ Pool/คิว และมี barrier คั่นระหว่างช่วง
+# STAR genomeGenerate อยู่ในช่วง "star_index" ซึ่ง build_star_indices รันทีละตัวนอก Pool
+TOOL_PHASES = {
+    "quast.py": "species", "busco": "species", "augustus": "species", "diamond": "species",
+    "emapper.py": "species", "prefetch": "qc", "fastq-dump": "qc", "fastqc": "qc",
+    "trimmomatic": "qc", "STAR": "align", "htseq-count": "quant",
+}
+PARALLEL_PHASES = ["species", "qc", "align", "quant"]
+
+# ชื่องานใน argument ของเครื่องมือ (SRA ID ก่อน เพราะ path ของ STAR/htseq มีชื่อ species ด้วย)
+TASK_PATTERNS = [re.compile(r"SRR\d+"), re.compile(r"sim_species_\d+")]
+
+# KO ที่ stub ของ EggNOG สุ่มใส่ให้ยีน (รวม KO ที่ใช้ทำ label)
+SIM_KOS = ["K10203", "K10251", "K00645", "K00208", "K01897", "K09836", "K15746",
+           "K02293", "K15744", "K02291", "K06443", "K00001", "K00002", "K00003"]
+
+# ==============================================================================
+# --- STUB TOOLS ---
+# --- โค้ดที่ stub แต่ละตัวเรียกใช้ (ผ่าน run_stub) ---
+# ==============================================================================
+
+_ACGT_TABLE = bytes(b"ACGT"[i % 4] for i in range(256))
+
+def _random_dna(n_bases):
+    return os.urandom(n_bases).translate(_ACGT_TABLE)
+
+def _arg(args, flag, default=None):
+    """ค่าของ flag เช่น _arg(args, "-o") หรือ '--flag=value'"""
+    for i, value in enumerate(args):
+        if value == flag and i + 1 < len(args):
+            return args[i + 1]
+        if value.startswith(flag + "="):
+            return value.split("=", 1)[1]
+    return default
+
+def _size_mb(path):
+    return os.path.getsize(path) / 1e6 if path and os.path.exists(path) else 0.0
+
+def _spin(seconds):
+    """ใช้ CPU 1 core เป็นเวลา seconds (วัดจาก CPU time ของ process)"""
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+def _consume(tool, input_mb, threads, include_base=True):
+    """
+    จำลองการทำงาน: ใช้ CPU threads core ตามสัดส่วน แล้วรอจนครบเวลา wall ตามโปรไฟล์
+    include_base=False สำหรับการเรียกสั้นๆ (เช่น fastq-dump -X) ที่คิดเวลาตามขนาดข้อมูลอย่างเดียว
+    """
+    profile = _load_profiles()[tool]
+    scale = float(os.environ.get("SIM_TIME_SCALE", "1"))
+    base = profile["base_seconds"] if include_base else 0.0
+    wall = (base + profile["seconds_per_mb"] * input_mb) * scale
+    cpu_wall = wall * profile["cpu_fraction"]
+    start = time.time()
+    workers = [multiprocessing.Process(target=_spin, args=(cpu_wall,)) for _ in range(max(1, threads))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    remaining = wall - (time.time() - start)
+    if remaining > 0:
+        time.sleep(remaining)
+    return start, wall
+
+def _load_profiles():
+    """โปรไฟล์เริ่มต้น + ค่าที่ override จากไฟล์ JSON ใน SIM_PROFILE (ถ้ามี)"""
+    profiles = {tool: dict(profile) for tool, profile in TOOL_PROFILES.items()}
+    override_file = os.environ.get("SIM_PROFILE")
+    if override_file and os.path.exists(override_file):
+        with open(override_file, 'r') as f:
+            for tool, values in json.load(f).items():
+                profiles.setdefault(tool, {}).update(values)
+    return profiles
+
+def _log_stub(tool, args, start, wall, threads, input_mb):
+    log_file = os.environ.get("SIM_LOG")
+    if not log_file:
+        return
+    phase = TOOL_PHASES[tool]
+    if tool == "STAR" and not _arg(args, "--readFilesIn"):
+        phase = "star_index"
+    joined = " ".join(args)
+    matches = [m.group(0) for m in (p.search(joined) for p in TASK_PATTERNS) if m]
+    line = json.dumps({"tool": tool, "phase": phase, "task": matches[0] if matches else None,
+                       "start": start, "end": time.time(), "planned_wall": wall,
+                       "threads": threads, "input_mb": round(input_mb, 3), "pid": os.getpid()})
+    with open(log_file, 'a') as f:
+        f.write(line + "\n")
+
+def _write_sized(path, ratio, input_mb, header=b""):
+    """เขียนไฟล์ output ขนาดประมาณ ratio * input"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(b"#" * int(ratio * input_mb * 1e6))
+
+def _augustus_gff(path, genome_mb):
+    """GFF แบบ AUGUSTUS (มี protein/coding sequence ใน comment) จำนวนยีน ~1 ยีนต่อ 10 kb"""
+    n_genes = max(1, int(genome_mb * 100))
+    with open(path, 'w') as f:
+        f.write("# This output was generated with AUGUSTUS (simulated).\n")
+        for i in range(1, n_genes + 1):
+            cds = _random_dna(900).decode()
+            protein = "M" + "".join(random.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(299))
+            start = i * 10000
+            f.write(f"# start gene g{i}\n")
+            f.write(f"chr1\tAUGUSTUS\tgene\t{start}\t{start + 899}\t1\t+\t.\tID=g{i};\n")
+            f.write(f"chr1\tAUGUSTUS\tCDS\t{start}\t{start + 899}\t1\t+\t0\tID=g{i}.t1.cds;Parent=g{i}.t1\n")
+            f.write("# coding sequence = [" + cds + "]\n")
+            f.write("# protein sequence = [" + protein + "]\n")
+            f.write(f"# end gene g{i}\n###\n")
+
+def _fasta_ids(path):
+    with open(path, 'r') as f:
+        return [line[1:].strip() for line in f if line.startswith(">")]
+
+def _fastq_records(sra_id, n_reads, read_length=100):
+    """FASTQ single-end ที่ชื่อ read เหมือน fastq-dump (@<SRA_ID>.<spot> <spot> length=...)"""
+    quality = b"I" * read_length
+    dna = _random_dna(n_reads * read_length)
+    name = sra_id.encode()
+    for i in range(1, n_reads + 1):
+        yield b"@%s.%d %d length=%d\n%s\n+\n%s\n" % (
+            name, i, i, read_length, dna[(i - 1) * read_length:i * read_length], quality)
+
+def run_stub(tool, args):
+    """จุดเข้าของ stub ทุกตัว: จำลองเวลา/CPU แล้วสร้าง output ที่ pipeline ต้องใช้"""
+    profile = _load_profiles()[tool]
+    ratio = profile["output_ratio"]
+
+    if tool == "quast.py":
+        input_mb, threads = _size_mb(args[-1]), int(_arg(args, "--threads", 1))
+        start, wall = _consume(tool, input_mb, threads)
+        out_dir = _arg(args, "--output-dir")
+        _write_sized(os.path.join(out_dir, "report.txt"), ratio, input_mb, b"Assembly  simulated\n")
+
+    elif tool == "busco":
+        input_mb, threads = _size_mb(_arg(args, "-i")), int(_arg(args, "-c", 1))
+        start, wall = _consume(tool, input_mb, threads)
+        name, lineage = _arg(args, "-o"), _arg(args, "-l")
+        summary = (f"# BUSCO (simulated) mode {_arg(args, '-m')}\n\t***** Results: *****\n\n"
+                   f"\tC:{random.uniform(80, 99):.1f}%[S:{random.uniform(75, 95):.1f}%,D:1.0%],"
+                   f"F:1.5%,M:2.0%,n:255\n").encode()
+        _write_sized(os.path.join(_arg(args, "--out_path"), name,
+                                  f"short_summary.specific.{lineage}.{name}.txt"), ratio, input_mb, summary)
+
+    elif tool == "augustus":
+        input_mb, threads = _size_mb(args[-1]), 1
+        start, wall = _consume(tool, input_mb, threads)
+        _augustus_gff(_arg(args, "--outfile"), input_mb)
+
+    elif tool == "diamond":
+        query = _arg(args, "-q")
+        input_mb, threads = _size_mb(query), int(_arg(args, "-p", 1))
+        start, wall = _consume(tool, input_mb, threads)
+        with open(_arg(args, "-o"), 'w') as f:
+            for gene_id in _fasta_ids(query):
+                if random.random() < 0.7:
+                    f.write(f"{gene_id}\tsp|P{random.randint(10000, 99999)}\t{random.uniform(30, 99):.1f}\t"
+                            f"300\t1e-{random.randint(6, 100)}\t{random.uniform(50, 600):.1f}\tSimulated protein\n")
+
+    elif tool == "emapper.py":
+        query = _arg(args, "-i")
+        input_mb, threads = _size_mb(query), int(_arg(args, "--cpu", 1))
+        start, wall = _consume(tool, input_mb, threads)
+        out_file = os.path.join(_arg(args, "--output_dir"),
+                                os.path.basename(_arg(args, "-o")) + ".emapper.annotations")
+        with open(out_file, 'w') as f:
+            f.write("## emapper (simulated)\n#query\tseed_ortholog\tevalue\tscore\teggNOG_OGs\tmax_annot_lvl\t"
+                    "COG_category\tDescription\tPreferred_name\tGOs\tEC\tKEGG_ko\tKEGG_Pathway\tKEGG_Module\t"
+                    "KEGG_Reaction\tKEGG_rclass\tBRITE\tKEGG_TC\tCAZy\tBiGG_Reaction\tPFAMs\n")
+            for gene_id in _fasta_ids(query):
+                kos = ",".join("ko:" + ko for ko in random.sample(SIM_KOS, random.randint(0, 2))) or "-"
+                f.write(f"{gene_id}\tseed\t1e-30\t120\tOG\tEukaryota\tS\tsimulated\t-\t-\t-\t{kos}"
+                        + "\t-" * 8 + "\tPF00001\n")
+
+    elif tool == "prefetch":
+        sra_id, out_dir = args[0], _arg(args, "-O")
+        with open(os.environ["SIM_COHORT"], 'r') as f:
+            n_reads = json.load(f)["samples"][sra_id]
+        input_mb, threads = n_reads * 60 / 1e6, 1  # .sra ~60 bytes ต่อ read
+        start, wall = _consume(tool, input_mb, threads)
+        _write_sized(os.path.join(out_dir, sra_id, f"{sra_id}.sra"), ratio, input_mb)
+
+    elif tool == "fastq-dump":
+        # cohort จำลองเป็น single-end ทั้งหมด (1 read ต่อ spot)
+        sra_file = args[-1]
+        n_reads = int(_size_mb(sra_file) * 1e6 / 60)
+        if _arg(args, "-X"):
+            n_reads = min(n_reads, int(_arg(args, "-X")))
+        input_mb, threads = n_reads * 60 / 1e6, 1
+        # -X (เช่น is_paired_end อ่านแค่ spot แรก) ไม่ควรเสียเวลาเริ่มต้นเท่าการ dump ทั้งไฟล์
+        start, wall = _consume(tool, input_mb, threads, include_base=not _arg(args, "-X"))
+        sra_id = os.path.basename(sra_file).replace(".sra", "")
+        if "-Z" in args:
+            for record in _fastq_records(sra_id, n_reads):
+                sys.stdout.buffer.write(record)
+        else:
+            # --split-files ของจริงเขียน <SRA_ID>_1.fastq แม้เป็น single-end
+            suffix = "_1" if "--split-files" in args else ""
+            with open(os.path.join(_arg(args, "--outdir", "."), f"{sra_id}{suffix}.fastq"), 'wb') as f:
+                for record in _fastq_records(sra_id, n_reads):
+                    f.write(record)
+
+    elif tool == "fastqc":
+        input_mb, threads = _size_mb(args[0]), 1
+        start, wall = _consume(tool, input_mb, threads)
+        base = os.path.basename(args[0]).rsplit(".", 1)[0]
+        for ext in ("_fastqc.html", "_fastqc.zip"):
+            _write_sized(os.path.join(_arg(args, "-o"), base + ext), ratio, input_mb)
+
+    elif tool == "trimmomatic":
+        threads = int(_arg(args, "-threads", 1))
+        positional = [a for a in args[1:] if not a.startswith("-") and ":" not in a and not a.isdigit()]
+        in_fastq, out_fastq = positional[0], positional[1]
+        input_mb = _size_mb(in_fastq)
+        start, wall = _consume(tool, input_mb, threads)
+        with open(in_fastq, 'rb') as f_in, open(out_fastq, 'wb') as f_out:
+            lines = f_in.readlines()
+            f_out.writelines(lines[:len(lines) // 4 * 4 * 9 // 10 // 4 * 4])
+
+    elif tool == "STAR":
+        threads = int(_arg(args, "--runThreadN", 1))
+        if _arg(args, "--runMode") == "genomeGenerate":
+            input_mb = _size_mb(_arg(args, "--genomeFastaFiles"))
+            start, wall = _consume(tool, input_mb, threads)
+            _write_sized(os.path.join(_arg(args, "--genomeDir"), "SA"), 8.0, input_mb)
+        elif _arg(args, "--readFilesIn"):
+            input_mb = _size_mb(_arg(args, "--readFilesIn"))
+            start, wall = _consume(tool, input_mb, threads)
+            prefix = _arg(args, "--outFileNamePrefix", "")
+            _write_sized(prefix + "Aligned.sortedByCoord.out.bam", ratio, input_mb)
+            _write_sized(prefix + "Log.final.out", 0.0, 0.0, b"Uniquely mapped reads % | 90.00%\n")
+        else:
+            # build_star_indices เรียกซ้ำแบบ shell=True ซึ่งไม่มี argument ส่งมา
+            input_mb, threads = 0.0, 1
+            start, wall = _consume(tool, input_mb, threads)
+
+    elif tool == "htseq-count":
+        bam_file, gff_file = args[-2], args[-1]
+        input_mb, threads = _size_mb(bam_file), 1
+        start, wall = _consume(tool, input_mb, threads)
+        with open(gff_file, 'r') as f:
+            for line in f:
+                cols = line.split("\t")
+                if len(cols) > 8 and cols[2] == "gene":
+                    sys.stdout.write(f"{cols[8].split(';')[0].replace('ID=', '')}\t{random.randint(0, 5000)}\n")
+
+    else:
+        raise ValueError(f"Unknown simulated tool: {tool}")
+
+    _log_stub(tool, args, start, wall, threads, input_mb)
+
+def install_stubs(bin_dir):
+    """สร้าง executable จำลองของทุกเครื่องมือใน bin_dir (ใส่ไว้หน้าสุดของ PATH)"""
+    os.makedirs(bin_dir, exist_ok=True)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    for tool in TOOL_PROFILES:
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(f"#!{sys.executable}\n"
+                    "import sys\n"
+                    f"sys.path.insert(0, {repo_dir!r})\n"
+                    "from pipeline_simulation import run_stub\n"
+                    f"run_stub({tool!r}, sys.argv[1:])\n")
+        os.chmod(path, 0o755)
+
+# ==============================================================================
+# --- SYNTHETIC COHORTS ---
+# ==============================================================================
+
+def make_genomics_cohort(data_dir, n_species, genome_mb, seed):
+    """สร้างโฟลเดอร์สปีชีส์จำลอง ขนาด genome แบบ lognormal รอบๆ genome_mb"""
+    rng = random.Random(seed)
+    species_list = []
+    for i in range(n_species):
+        species_name = f"sim_species_{i:04d}"
+        size = max(1000, int(rng.lognormvariate(0, 0.6) * genome_mb * 1e6))
+        species_dir = os.path.join(data_dir, species_name)
+        os.makedirs(species_dir, exist_ok=True)
+        with open(os.path.join(species_dir, "genome.fna"), 'wb') as f:
+            f.write(b">chr1\n")
+            dna = _random_dna(size)
+            for pos in range(0, size, 80):
+                f.write(dna[pos:pos + 80] + b"\n")
+        species_list.append(species_name)
+    return species_list
+
+def make_transcriptomics_cohort(project_dir, n_samples, n_species, reads_per_sample, seed):
+    """สร้าง samples.csv, reference_data และ cohort.json (จำนวน read ของแต่ละ SRA ID)"""
+    rng = random.Random(seed)
+    ref_dir = os.path.join(project_dir, "reference_data")
+    os.makedirs(ref_dir, exist_ok=True)
+    species_list = [f"sim_species_{i:04d}" for i in range(n_species)]
+    for species_name in species_list:
+        with open(os.path.join(ref_dir, f"{species_name}.fa"), 'wb') as f:
+            f.write(b">chr1\n" + _random_dna(200000) + b"\n")
+        _augustus_gff(os.path.join(ref_dir, f"{species_name}.gff3"), 2.0)
+    with open(os.path.join(ref_dir, "TruSeq3-SE.fa"), 'w') as f:
+        f.write(">TruSeq3_IndexedAdapter\nAGATCGGAAGAGCACACGTCTGAACTCCAGTCAC\n")
+
+    samples = {}
+    with open(os.path.join(project_dir, "samples.csv"), 'w') as f:
+        f.write("sra_id,species_name\n")
+        for i in range(n_samples):
+            sra_id = f"SRR{9000000 + i}"
+            samples[sra_id] = max(100, int(rng.lognormvariate(0, 0.7) * reads_per_sample))
+            f.write(f"{sra_id},{species_list[i % n_species]}\n")
+    cohort_file = os.path.join(project_dir, "cohort.json")
+    with open(cohort_file, 'w') as f:
+        json.dump({"samples": samples}, f)
+    return cohort_file
+
+# ==============================================================================
+# --- BENCHMARK RUNNER ---
+# ==============================================================================
+
+def run_genomics_child(settings):
+    """รันใน process ลูก: ตั้งค่า Genomics.py ให้ชี้ไปที่ cohort จำลอง แล้วเรียก main()"""
+    import Genomics as G
+    result_dir = settings["result_dir"]
+    G.BASE_DIR = settings["data_dir"]
+    G.RESULT_BASE_DIR = result_dir
+    for name, folder in (("QUAST_OUTPUT_DIR", "QUAST_results"), ("BUSCO_OUTPUT_DIR", "BUSCO_results"),
+                         ("BUSCO_PROTEIN_OUTPUT_DIR", "BUSCO_protein_results"),
+                         ("AUGUSTUS_OUTPUT_DIR", "AUGUSTUS_results"), ("PROTEIN_OUTPUT_DIR", "Proteins_faa"),
+                         ("CDS_OUTPUT_DIR", "CDS_fasta"), ("DIAMOND_OUTPUT_DIR", "DIAMOND_results"),
+                         ("EGGNOG_OUTPUT_DIR", "EGGNOG_results")):
+        setattr(G, name, os.path.join(result_dir, folder))
+        os.makedirs(getattr(G, name), exist_ok=True)
+    os.makedirs(os.path.join(result_dir, "00_Logs"), exist_ok=True)
+    species_list = settings["species"]
+    G.BUSCO_LINEAGE_MAP = {s: "eukaryota_odb10" for s in species_list}
+    G.AUGUSTUS_SPECIES_MAP = {s: "generic" for s in species_list}
+    G.ANNOTATION_DB_PATH = os.path.join(result_dir, "annotations.sqlite")
+    G.RUNTIME_HISTORY_DB = os.path.join(result_dir, "00_Logs", "runtime_history.sqlite")
+    G.STATUS_DIR = os.path.join(result_dir, "00_Logs", "status")
+    G.WORK_QUEUE_DB = os.path.join(result_dir, "work_queue.sqlite")
+    G.PARALLEL_JOBS = settings["jobs"]
+    G.LOCAL_QUEUE_WORKERS = settings["jobs"]
+    G.TOTAL_CPU_CORE = settings["cores"]
+    G.EXECUTION_BACKEND = settings["backend"]
+    G.SCHEDULING = settings["scheduling"]
+    G.BUSCO_MODE = settings["busco_mode"]
+    G.METRICS_PORT = None
+    G.DRY_RUN = False
+    G.main()
+
+def run_transcriptomics_child(settings):
+    """รันใน process ลูก (cwd = โฟลเดอร์โปรเจกต์จำลอง): ตั้งค่า Transcriptomics.py แล้วเรียก main()"""
+    import Transcriptomics as T
+    T.NUM_PARALLEL_JOBS = settings["jobs"]
+    T.LOCAL_QUEUE_WORKERS = settings["jobs"]
+    T.EXECUTION_BACKEND = settings["backend"]
+    T.SCHEDULING = settings["scheduling"]
+    T.QC_ENGINE = settings["qc_engine"]
+    T.METRICS_PORT = None
+    T.DRY_RUN = False
+    T.main()
+
+def summarize_stub_log(log_file, wall, cpu_seconds, cores, slots):
+    """คำนวณเวลารวม, การใช้ core และ overhead ของการจัดงานจาก log ของ stub"""
+    records = []
+    if os.path.exists(log_file):
+        with open(log_file, 'r') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    per_tool = {}
+    task_seconds = {}   # phase -> {task: วินาทีรวมของเครื่องมือทุกตัวในงานนั้น}
+    serial_seconds = 0.0
+    for r in records:
+        seconds = r["end"] - r["start"]
+        stats = per_tool.setdefault(r["tool"], {"calls": 0, "seconds": 0.0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        if r["phase"] in PARALLEL_PHASES:
+            tasks = task_seconds.setdefault(r["phase"], {})
+            tasks[r["task"]] = tasks.get(r["task"], 0.0) + seconds
+        else:
+            serial_seconds += seconds
+    tool_seconds = sum(s["seconds"] for s in per_tool.values())
+
+    # เวลาขั้นต่ำถ้าไม่มี overhead เลย: แต่ละช่วงต้องรอช่วงก่อนหน้าเสร็จ (barrier)
+    # ในช่วงหนึ่งใช้ไม่น้อยกว่า max(เวลารวม / slot, งานที่นานที่สุด) ส่วนงานนอก slot (STAR index) รันทีละตัว
+    phases = {}
+    for phase in PARALLEL_PHASES:
+        if phase not in task_seconds:
+            continue
+        tasks = task_seconds[phase]
+        total = sum(tasks.values())
+        phases[phase] = {"tasks": len(tasks), "tool_seconds": round(total, 2),
+                         "ideal_seconds": round(max(total / max(1, slots), max(tasks.values())), 2)}
+    ideal_wall = sum(p["ideal_seconds"] for p in phases.values()) + serial_seconds
+    return {
+        "wall_seconds": round(wall, 2),
+        "cpu_seconds": round(cpu_seconds, 2),
+        "core_utilization_percent": round(cpu_seconds / (wall * cores) * 100, 1) if wall > 0 else 0.0,
+        "tool_calls": len(records),
+        "tool_seconds": round(tool_seconds, 2),
+        "serial_tool_seconds": round(serial_seconds, 2),
+        "phases": phases,
+        "ideal_wall_seconds": round(ideal_wall, 2),
+        "scheduling_overhead_seconds": round(wall - ideal_wall, 2),
+        "scheduling_overhead_percent": round((wall - ideal_wall) / wall * 100, 1) if wall > 0 else 0.0,
+        "per_tool": {tool: {"calls": s["calls"], "seconds": round(s["seconds"], 2)}
+                     for tool, s in sorted(per_tool.items())},
+    }
+
+def reset_run_dirs(run_dirs, history_file, keep_history):
+    """
+    ลบ cohort และผลลัพธ์ของการรันก่อน (เก็บ bin/ ไว้) ทุกการรันจึงเริ่มจากศูนย์เท่ากัน
+    ไม่เช่นนั้น pipeline จะข้ามขั้นตอนที่มี output อยู่แล้ว และผลเทียบ scheduler จะไม่ถูกต้อง
+    keep_history=True เก็บ runtime_history.sqlite ไว้ (ทดสอบ longest_first ที่มีประวัติแล้ว)
+    """
+    saved_history = None
+    if keep_history and os.path.exists(history_file):
+        with open(history_file, 'rb') as f:
+            saved_history = f.read()
+    for run_dir in run_dirs:
+        if os.path.exists(run_dir):
+            shutil.rmtree(run_dir)
+    if saved_history is not None:
+        os.makedirs(os.path.dirname(history_file), exist_ok=True)
+        with open(history_file, 'wb') as f:
+            f.write(saved_history)
+
+def run_benchmark(args):
+    """สร้าง cohort จำลอง -> รัน pipeline พร้อม stub บน PATH -> สรุปผล"""
+    work_dir = os.path.abspath(args.workdir)
+    bin_dir = os.path.join(work_dir, "bin")
+    log_file = os.path.join(work_dir, "stub_calls.jsonl")
+    install_stubs(bin_dir)
+    if os.path.exists(log_file):
+        os.remove(log_file)
+
+    env = dict(os.environ)
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+    env["SIM_TIME_SCALE"] = str(args.time_scale)
+    env["SIM_LOG"] = log_file
+    if args.profile:
+        env["SIM_PROFILE"] = os.path.abspath(args.profile)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = repo_dir + os.pathsep + env.get("PYTHONPATH", "")
+
+    print(f"Preparing synthetic {args.pipeline} cohort in {work_dir}...")
+    if args.pipeline == "genomics":
+        data_dir = os.path.join(work_dir, "genomics_data")
+        result_dir = os.path.join(work_dir, "genomics_result")
+        reset_run_dirs([data_dir, result_dir],
+                       os.path.join(result_dir, "00_Logs", "runtime_history.sqlite"), args.keep_history)
+        species = make_genomics_cohort(data_dir, args.species, args.genome_mb, args.seed)
+        settings = {"data_dir": data_dir, "result_dir": result_dir,
+                    "species": species, "jobs": args.jobs, "cores": args.cores, "backend": args.backend,
+                    "scheduling": args.scheduling, "busco_mode": args.busco_mode}
+        child = "run_genomics_child"
+        cwd = work_dir
+        slots = args.jobs
+    else:
+        cwd = os.path.join(work_dir, "transcriptomics")
+        reset_run_dirs([cwd], os.path.join(cwd, "analysis_output", "runtime_history.sqlite"),
+                       args.keep_history)
+        os.makedirs(cwd, exist_ok=True)
+        env["SIM_COHORT"] = make_transcriptomics_cohort(cwd, args.samples, args.species,
+                                                        args.reads, args.seed)
+        settings = {"jobs": args.jobs, "backend": args.backend, "scheduling": args.scheduling,
+                    "qc_engine": args.qc_engine}
+        child = "run_transcriptomics_child"
+        slots = args.jobs
+
+    code = (f"import json\nfrom pipeline_simulation import {child}\n"
+            f"{child}(json.loads({json.dumps(json.dumps(settings))}))\n")
+    print(f"Running {args.pipeline} pipeline against stub tools (time scale {args.time_scale})...")
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    with open(os.path.join(work_dir, f"{args.pipeline}_run.log"), 'w') as run_log:
+        process = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                                 stdout=run_log, stderr=subprocess.STDOUT)
+    wall = time.time() - start
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_seconds = ((usage_after.ru_utime - usage_before.ru_utime)
+                   + (usage_after.ru_stime - usage_before.ru_stime))
+
+    report = summarize_stub_log(log_file, wall, cpu_seconds, args.cores, slots)
+    report.update({"pipeline": args.pipeline, "exit_code": process.returncode, "settings": {
+        k: v for k, v in vars(args).items() if k != "workdir"}})
+    report_file = os.path.join(work_dir, f"{args.pipeline}_benchmark.json")
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("="*70)
+    print(f"Wall time:            {report['wall_seconds']} s")
+    print(f"CPU time:             {report['cpu_seconds']} s")
+    print(f"Core utilization:     {report['core_utilization_percent']}% of {args.cores} cores")
+    print(f"Tool calls:           {report['tool_calls']} ({report['tool_seconds']} s inside tools)")
+    for phase, stats in report["phases"].items():
+        print(f"  {phase:<8} {stats['tasks']:>6} tasks, {stats['tool_seconds']} s in tools, "
+              f"ideal {stats['ideal_seconds']} s")
+    print(f"Serial tool time:     {report['serial_tool_seconds']} s (outside the parallel slots)")
+    print(f"Ideal wall time:      {report['ideal_wall_seconds']} s ({slots} slots fully busy per stage)")
+    print(f"Scheduling overhead:  {report['scheduling_overhead_seconds']} s "
+          f"({report['scheduling_overhead_percent']}% of wall time)")
+    print(f"Report: {report_file}")
+    if process.returncode != 0:
+        print(f"[WARNING] Pipeline exited with code {process.returncode}. "
+              f"See {os.path.join(work_dir, args.pipeline + '_run.log')}")
+    return report
+
+def main():
+    """
+    ตัวอย่าง:
+    python pipeline_simulation.py genomics --species 200 --jobs 4 --cores 16 --time-scale 0.01
+    python pipeline_simulation.py transcriptomics --samples 2000 --species 20 --jobs 8 --time-scale 0.005
+    """
+    parser = argparse.ArgumentParser(description="Benchmark pipeline orchestration with stub tools")
+    parser.add_argument("pipeline", choices=["genomics", "transcriptomics"])
+    parser.add_argument("--workdir", default="sim_run", help="โฟลเดอร์ที่ใช้สร้าง cohort และผลลัพธ์จำลอง")
+    parser.add_argument("--species", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--genome-mb", type=float, default=2.0, help="ขนาด genome เฉลี่ย (MB)")
+    parser.add_argument("--reads", type=int, default=20000, help="จำนวน read เฉลี่ยต่อ sample")
+    parser.add_argument("--jobs", type=int, default=4, help="จำนวนงานที่รันพร้อมกัน")
+    parser.add_argument("--cores", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--backend", choices=["pool", "queue"], default="pool")
+    parser.add_argument("--scheduling", choices=["longest_first", "input_order"], default="longest_first")
+    parser.add_argument("--busco-mode", choices=["genome", "proteins", "both"], default="genome")
+    parser.add_argument("--qc-engine", choices=["builtin", "fastqc"], default="builtin")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="คูณเวลาของทุก stub (1 = เวลาตามโปรไฟล์)")
+    parser.add_argument("--profile", help="ไฟล์ JSON สำหรับ override TOOL_PROFILES")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-history", action="store_true",
+                        help="เก็บ runtime_history.sqlite จากการรันก่อน (ค่าเริ่มต้น ลบทุกอย่างยกเว้น bin/)")
+    run_benchmark(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
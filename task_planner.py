@@ -0,0 +1,133 @@
+import math
+import time
+import sqlite3
+import statistics
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# --- วางแผนลำดับงานแบบ Longest-Job-First จากเวลาที่เคยรันจริง ---
+# ==============================================================================
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runtimes (
+    pipeline TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    input_bytes INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    status TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runtimes_pipeline ON runtimes (pipeline, task_id);
+"""
+
+def record_runtime(history_db, pipeline, task_id, input_bytes, seconds, status):
+    """บันทึกเวลาที่ใช้ของงาน 1 งาน (เรียกจาก worker ได้พร้อมกันหลาย process)"""
+    conn = sqlite3.connect(history_db, timeout=60)
+    try:
+        with conn:
+            conn.executescript(HISTORY_SCHEMA)
+            conn.execute("INSERT INTO runtimes VALUES (?, ?, ?, ?, ?, ?)",
+                         (pipeline, task_id, int(input_bytes), float(seconds), status, time.time()))
+    finally:
+        conn.close()
+
+def load_history(history_db, pipeline):
+    """คืนค่า list ของ (task_id, input_bytes, seconds) ที่รันสำเร็จ"""
+    conn = sqlite3.connect(history_db, timeout=60)
+    try:
+        conn.executescript(HISTORY_SCHEMA)
+        return conn.execute(
+            "SELECT task_id, input_bytes, seconds FROM runtimes "
+            "WHERE pipeline = ? AND status LIKE '%Success%' ORDER BY finished_at",
+            (pipeline,)).fetchall()
+    finally:
+        conn.close()
+
+class RuntimeModel:
+    """
+    ประมาณเวลารันจากขนาด input: seconds = a * bytes^b (fit แบบ log-log จากประวัติ)
+    - งานที่เคยรันแล้ว ใช้เวลาครั้งล่าสุดปรับตามขนาด input ที่เปลี่ยนไป
+    - มีประวัติจุดเดียว ใช้อัตรา seconds/byte
+    - ไม่มีประวัติเลย ทำนายไม่ได้ (คืนค่า None) แต่ยังเรียงตามขนาด input ได้
+    """
+
+    def __init__(self, history):
+        self.last_run = {task_id: (size, seconds) for task_id, size, seconds in history}
+        points = [(math.log(size), math.log(seconds)) for _, size, seconds in history
+                  if size > 0 and seconds > 0]
+        self.coef = None
+        self.exponent = 1.0
+        if len({x for x, _ in points}) >= 2:
+            xs, ys = zip(*points)
+            mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+            slope = (sum((x - mean_x) * (y - mean_y) for x, y in points)
+                     / sum((x - mean_x) ** 2 for x in xs))
+            self.exponent = slope
+            self.coef = math.exp(mean_y - slope * mean_x)
+        elif points:
+            self.coef = statistics.median(math.exp(y - x) for x, y in points)
+        self.fallback = statistics.median(s for _, _, s in history) if history else None
+
+    def predict(self, task_id, input_bytes):
+        """คืนค่าเวลาที่คาดว่าจะใช้ (วินาที) หรือ None ถ้าไม่มีประวัติเลย"""
+        if task_id in self.last_run:
+            size, seconds = self.last_run[task_id]
+            if size > 0 and input_bytes > 0:
+                return seconds * (input_bytes / size) ** self.exponent
+            return seconds
+        if self.coef is not None and input_bytes > 0:
+            return self.coef * input_bytes ** self.exponent
+        return self.fallback
+
+def predict_tasks(task_ids, tasks, input_sizes, model):
+    """คืนค่า list ของ (task_id, task, input_bytes, predicted_seconds) ตามลำดับเดิม"""
+    return [(task_id, task, size, model.predict(task_id, size))
+            for task_id, task, size in zip(task_ids, tasks, input_sizes)]
+
+def plan_longest_first(planned):
+    """
+    เรียงงานจากนานที่สุดไปเร็วที่สุด
+    งานที่ทำนายไม่ได้จะเรียงตามขนาด input ต่อท้าย (หรือทั้งหมดถ้าไม่มีประวัติ)
+    """
+    return sorted(planned, key=lambda p: (p[3] is not None, p[3] or 0, p[2]), reverse=True)
+
+def simulate_slots(predicted_seconds, n_slots):
+    """
+    จำลองการแจกงานตามลำดับให้ slot ที่ว่างก่อน (แบบเดียวกับ Pool ที่ chunksize=1)
+    คืนค่า (เวลารวมที่คาดว่าจะเสร็จ, เวลาที่แต่ละ slot ทำงาน)
+    """
+    slots = [0.0] * max(1, n_slots)
+    for seconds in predicted_seconds:
+        idx = slots.index(min(slots))
+        slots[idx] += seconds or 0.0
+    return max(slots), slots
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "unknown"
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m"
+
+def print_plan(title, planned, n_slots):
+    """พิมพ์ลำดับงาน, เวลาที่คาดว่าจะเสร็จ และสัดส่วนเวลาที่แต่ละ slot ทำงาน (dry-run)"""
+    print("\n" + "="*70)
+    print(f"PLAN: {title} ({len(planned)} tasks, {n_slots} parallel slots)")
+    print("="*70)
+    print(f"{'#':>4} | {'Task':<32} | {'Input (MB)':>11} | {'Predicted':>9}")
+    for i, (task_id, _, size, seconds) in enumerate(planned, 1):
+        print(f"{i:>4} | {task_id:<32} | {size / 1e6:>11.1f} | {_format_seconds(seconds):>9}")
+
+    if all(p[3] is None for p in planned):
+        if all(p[2] == 0 for p in planned):
+            print("No runtime history and no input sizes: tasks keep their input order, finish time unknown.")
+        else:
+            print("No runtime history yet: finish time unknown (longest_first orders by input size only).")
+        return
+    makespan, slots = simulate_slots([p[3] for p in planned], n_slots)
+    finish = time.strftime("%Y-%m-%d %H:%M", time.localtime(time.time() + makespan))
+    print(f"\nPredicted wall time: {_format_seconds(makespan)} (finish around {finish})")
+    for i, busy in enumerate(slots, 1):
+        utilization = busy / makespan * 100 if makespan > 0 else 0.0
+        print(f"  Slot {i}: busy {_format_seconds(busy)} ({utilization:.0f}%)")
+    if any(p[3] is None for p in planned):
+        print("  (Tasks with unknown runtime are counted as 0.)")
@@ -0,0 +1,230 @@
+import os
+import sys
+import csv
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from gsva_labeling import load_tpm
+
+# ==============================================================================
+# --- CONFIGURATION ---
+# --- ค่าเดียวกับ WGCNA_CONFIG ใน WGCNA_analysis.R ---
+# ==============================================================================
+
+# 1. Path ของ TPM และโฟลเดอร์ที่เก็บผลลัพธ์ (ไฟล์ memmap จะอยู่ที่นี่ ต้องมีพื้นที่ดิสก์พอ)
+TPM_DIR = "/path/to/transcriptome_data/Haematococcus_pluvialis"
+OUTPUT_WGCNA = "/path/to/result_all/wgcna_blockwise"
+
+# 2. ค่า soft threshold
+POWERS = list(range(1, 11)) + list(range(12, 21, 2))
+RSQUARED_CUT = 0.85
+N_BREAKS = 10
+
+# 3. การกรองยีน
+# None = ไม่กรองด้วย variance (ใช้ยีนทั้งหมดได้เพราะไม่ต้องโหลด matrix ทั้งก้อนเข้า RAM)
+# 0.5 = กรองแบบเดียวกับ WGCNA_analysis.R (ตัดยีนที่ variance ต่ำกว่า median)
+VARIANCE_QUANTILE = None
+
+# 4. ขนาด block และจำนวน thread
+# RAM ที่ใช้ต่อ thread ประมาณ BLOCK_SIZE x จำนวนยีน x 4 bytes x 3 (float32 ทั้งหมด)
+# เช่น 2000 x 60,000 ยีน = ~1.4 GB ต่อ thread (x N_THREADS)
+BLOCK_SIZE = 2000
+N_THREADS = 4
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# ==============================================================================
+
+def prepare_datexpr(tpm_matrix, gene_ids, variance_quantile=VARIANCE_QUANTILE):
+    """
+    log2(TPM + 1), กรองยีนที่ค่าเฉลี่ย <= 1, (ถ้าตั้งไว้) กรองด้วย variance
+    และตัดยีนที่ variance เป็น 0 (แทน goodSamplesGenes)
+    คืนค่า (gene_ids, datExpr แบบ samples x genes)
+    """
+    expr = np.log2(tpm_matrix + 1.0)
+    keep = expr.mean(axis=1) > 1
+    variance = expr.var(axis=1, ddof=1)
+    if variance_quantile is not None:
+        keep &= variance > np.quantile(variance[keep], variance_quantile)
+    keep &= np.isfinite(expr).all(axis=1) & (variance > 0)
+    return [g for g, k in zip(gene_ids, keep) if k], expr[keep].T
+
+def standardize(dat_expr):
+    """ปรับแต่ละยีนให้ Z.T @ Z = correlation matrix (Pearson)"""
+    centered = dat_expr - dat_expr.mean(axis=0)
+    norm = np.sqrt((centered ** 2).sum(axis=0))
+    return (centered / norm).astype(np.float32)
+
+def _row_blocks(n_genes, block_size):
+    return [(start, min(start + block_size, n_genes)) for start in range(0, n_genes, block_size)]
+
+def _map_blocks(func, blocks, n_threads):
+    """รันฟังก์ชันต่อ block ด้วย thread pool (numpy ปล่อย GIL ระหว่างคูณ matrix)"""
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return list(executor.map(func, blocks))
+
+def block_connectivity(z, powers, block_size=BLOCK_SIZE, n_threads=N_THREADS):
+    """
+    คำนวณ connectivity k = sum_j |cor|^power - 1 ของทุก power ในการอ่าน correlation รอบเดียว
+    คืนค่า array ขนาด (len(powers), genes)
+    """
+    n_genes = z.shape[1]
+
+    def work(block):
+        start, end = block
+        abs_cor = np.abs(z[:, start:end].T @ z)
+        return start, end, np.stack([(abs_cor ** p).sum(axis=1) - 1.0 for p in powers])
+
+    connectivity = np.empty((len(powers), n_genes))
+    for start, end, k in _map_blocks(work, _row_blocks(n_genes, block_size), n_threads):
+        connectivity[:, start:end] = k
+    return connectivity
+
+def scale_free_fit_index(k, n_breaks=N_BREAKS):
+    """เลียนแบบ scaleFreeFitIndex ของ WGCNA คืนค่า (R^2, slope)"""
+    edges = np.linspace(k.min(), k.max(), n_breaks + 1)
+    bins = np.clip(np.searchsorted(edges, k, side='left') - 1, 0, n_breaks - 1)
+    counts = np.bincount(bins, minlength=n_breaks)
+    sums = np.bincount(bins, weights=k, minlength=n_breaks)
+    mids = (edges[:-1] + edges[1:]) / 2.0
+    dk = np.where(counts > 0, sums / np.maximum(counts, 1), mids)
+    dk = np.where(dk == 0, mids, dk)
+    log_dk = np.log10(dk)
+    log_p_dk = np.log10(counts / len(k) + 1e-9)
+    slope, intercept = np.polyfit(log_dk, log_p_dk, 1)
+    residual = log_p_dk - (slope * log_dk + intercept)
+    total = ((log_p_dk - log_p_dk.mean()) ** 2).sum()
+    r_squared = 1.0 - (residual ** 2).sum() / total if total > 0 else 0.0
+    return r_squared, slope
+
+def pick_soft_threshold(z, powers=POWERS, rsquared_cut=RSQUARED_CUT,
+                        block_size=BLOCK_SIZE, n_threads=N_THREADS):
+    """
+    เทียบเท่า pickSoftThreshold (unsigned) คืนค่า (power_estimate หรือ None, ตาราง fit)
+    """
+    connectivity = block_connectivity(z, powers, block_size, n_threads)
+    fit_table = []
+    for power, k in zip(powers, connectivity):
+        r_squared, slope = scale_free_fit_index(k)
+        fit_table.append({
+            "Power": power,
+            "SFT.R.sq": round(float(-np.sign(slope) * r_squared), 4),
+            "slope": round(float(slope), 4),
+            "mean.k.": round(float(k.mean()), 4),
+            "median.k.": round(float(np.median(k)), 4),
+            "max.k.": round(float(k.max()), 4),
+        })
+    for row in fit_table:
+        if row["SFT.R.sq"] > rsquared_cut:
+            return row["Power"], fit_table
+    return None, fit_table
+
+def blockwise_adjacency(z, power, out_path, block_size=BLOCK_SIZE, n_threads=N_THREADS):
+    """เขียน adjacency = |cor|^power (diagonal = 0) ลง memmap ทีละ block"""
+    n_genes = z.shape[1]
+    adjacency = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32,
+                                          shape=(n_genes, n_genes))
+
+    def work(block):
+        start, end = block
+        adj = np.abs(z[:, start:end].T @ z) ** power
+        adj[np.arange(end - start), np.arange(start, end)] = 0.0
+        adjacency[start:end] = adj
+
+    _map_blocks(work, _row_blocks(n_genes, block_size), n_threads)
+    adjacency.flush()
+    return adjacency
+
+def blockwise_tom(adjacency, out_path, block_size=BLOCK_SIZE, n_threads=N_THREADS):
+    """
+    เขียน TOM ลง memmap ทีละ block (เทียบเท่า TOMsimilarity แบบ unsigned)
+    TOM_ij = (l_ij + a_ij) / (min(k_i, k_j) + 1 - a_ij), l = A @ A, TOM_ii = 1
+    """
+    n_genes = adjacency.shape[0]
+    blocks = _row_blocks(n_genes, block_size)
+
+    def row_sums(block):
+        start, end = block
+        return np.asarray(adjacency[start:end], dtype=np.float64).sum(axis=1)
+
+    # รวมเป็น float64 เพื่อความแม่นยำ แต่ใช้ float32 ตอนคำนวณ block ไม่ให้ array ต่อ thread ใหญ่เป็น 2 เท่า
+    k = np.concatenate(_map_blocks(row_sums, blocks, n_threads)).astype(np.float32)
+    tom = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32,
+                                    shape=(n_genes, n_genes))
+
+    def work(block):
+        start, end = block
+        a_rows = np.asarray(adjacency[start:end])
+        shared = np.zeros((end - start, n_genes), dtype=np.float32)
+        for col_start, col_end in blocks:
+            # adjacency สมมาตร: A[:, cols] = A[cols, :].T
+            shared += a_rows[:, col_start:col_end] @ np.asarray(adjacency[col_start:col_end])
+        # คำนวณแบบ in-place: มี array ขนาด block x genes แค่ a_rows, shared, denom
+        denom = np.minimum(k[start:end, None], k[None, :])
+        denom += 1.0
+        denom -= a_rows
+        shared += a_rows
+        shared /= denom
+        shared[np.arange(end - start), np.arange(start, end)] = 1.0
+        tom[start:end] = shared
+
+    _map_blocks(work, blocks, n_threads)
+    tom.flush()
+    return tom
+
+def write_fit_table(fit_table, out_file):
+    with open(out_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(fit_table[0].keys()))
+        writer.writeheader()
+        writer.writerows(fit_table)
+
+def run_network(config):
+    """ฟังก์ชันหลัก: เตรียม datExpr -> pickSoftThreshold -> adjacency -> TOM (บนดิสก์)"""
+    output_dir = config["OUTPUT_WGCNA"]
+    os.makedirs(output_dir, exist_ok=True)
+
+    # --- 1. LOAD TPM & PREPARE EXPRESSION ---
+    gene_ids, sample_names, tpm_matrix = load_tpm(config["TPM_DIR"])
+    gene_ids, dat_expr = prepare_datexpr(tpm_matrix, gene_ids, config["VARIANCE_QUANTILE"])
+    print(f"Expression ready: {dat_expr.shape[0]} samples x {dat_expr.shape[1]} genes")
+    with open(os.path.join(output_dir, "genes.txt"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(gene_ids) + "\n")
+
+    z = standardize(dat_expr)
+
+    # --- 2. SOFT THRESHOLD ---
+    chosen_power, fit_table = pick_soft_threshold(z, config["POWERS"], config["RSQUARED_CUT"],
+                                                  config["BLOCK_SIZE"], config["N_THREADS"])
+    write_fit_table(fit_table, os.path.join(output_dir, "softThreshold.csv"))
+    if chosen_power is None:
+        raise ValueError("Cannot determine soft threshold")
+    print(f"Chosen power: {chosen_power}")
+
+    # --- 3. ADJACENCY & TOM (memmap) ---
+    adjacency_file = os.path.join(output_dir, "adjacency.npy")
+    tom_file = os.path.join(output_dir, "TOM.npy")
+    adjacency = blockwise_adjacency(z, chosen_power, adjacency_file,
+                                    config["BLOCK_SIZE"], config["N_THREADS"])
+    print(f"  > Adjacency written: {adjacency_file}")
+    blockwise_tom(adjacency, tom_file, config["BLOCK_SIZE"], config["N_THREADS"])
+    print(f"  > TOM written: {tom_file}")
+    print("NETWORK CONSTRUCTION COMPLETE")
+
+def main():
+    config = {
+        "TPM_DIR": TPM_DIR,
+        "OUTPUT_WGCNA": OUTPUT_WGCNA,
+        "POWERS": POWERS,
+        "RSQUARED_CUT": RSQUARED_CUT,
+        "VARIANCE_QUANTILE": VARIANCE_QUANTILE,
+        "BLOCK_SIZE": BLOCK_SIZE,
+        "N_THREADS": N_THREADS,
+    }
+    try:
+        run_network(config)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import importlib
+import threading
+import traceback
+import multiprocessing
+
+# ==============================================================================
+# --- CONFIGURATION ---
+# --- ค่าเริ่มต้นของคิวงาน (แก้ได้ผ่าน argument ของ worker) ---
+# ==============================================================================
+
+# ระยะเวลา lease ของงาน (วินาที) ถ้า worker ไม่ส่ง heartbeat ภายในเวลานี้ งานจะกลับเข้าคิว
+LEASE_SECONDS = 600
+# ส่ง heartbeat ทุกๆ กี่วินาที (ควรน้อยกว่า LEASE_SECONDS หลายเท่า)
+HEARTBEAT_SECONDS = 60
+# worker ว่างจะเช็คคิวใหม่ทุกๆ กี่วินาที
+POLL_SECONDS = 5
+# ถ้างานถูก claim เกินจำนวนครั้งนี้ (worker ตายซ้ำๆ) จะถือว่า failed
+MAX_ATTEMPTS = 3
+
+# ==============================================================================
+# --- SCRIPT LOGIC ---
+# ==============================================================================
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    queue TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    func TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    submitted_at REAL,
+    position INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    PRIMARY KEY (queue, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (queue, status, lease_expires);
+"""
+
+def make_worker_id():
+    """ชื่อ worker = hostname:pid เพื่อให้รู้ว่างานอยู่บนเครื่องไหน"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def resolve_func(func_ref):
+    """แปลง 'Genomics:run_species_pipeline' เป็นฟังก์ชัน"""
+    module_name, func_name = func_ref.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+class WorkQueue:
+    """
+    คิวงานบน SQLite ที่วางไว้บน shared filesystem (เช่น /home_sbi_cold)
+    worker บนทุกเครื่องที่ mount ไดรฟ์เดียวกัน claim งานได้ด้วย lease + heartbeat
+    หมายเหตุ: ใช้ journal_mode=DELETE เพราะ WAL ใช้กับ NFS ไม่ได้ และนาฬิกาของทุกเครื่องควรตรงกัน (NTP)
+    """
+
+    def __init__(self, db_path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        conn = self._connect()
+        try:
+            conn.executescript(QUEUE_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        return conn
+
+    def _transaction(self, func):
+        """รัน func(conn) ภายใต้ BEGIN IMMEDIATE (ล็อกเขียนก่อนอ่าน กันสอง worker claim งานเดียวกัน)"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = func(conn)
+                conn.execute("COMMIT")
+                return value
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def submit(self, queue, func_ref, tasks):
+        """
+        ส่งงานเข้าคิว tasks = list ของ (task_id, payload)
+        งานที่เคยส่งแล้วจะถูกรีเซ็ตเป็น queued ยกเว้นงานที่กำลังรันอยู่และ lease ยังไม่หมด
+        worker จะ claim งานตามลำดับใน tasks (เช่น ลำดับ longest-first จาก task_planner)
+        """
+        now = time.time()
+
+        def work(conn):
+            conn.executemany(
+                """INSERT INTO tasks (queue, task_id, func, payload, status, attempts, submitted_at, position)
+                   VALUES (?, ?, ?, ?, 'queued', 0, ?, ?)
+                   ON CONFLICT (queue, task_id) DO UPDATE SET
+                       func = excluded.func, payload = excluded.payload, status = 'queued',
+                       worker = NULL, attempts = 0, lease_expires = NULL, result = NULL,
+                       submitted_at = excluded.submitted_at, position = excluded.position,
+                       started_at = NULL, finished_at = NULL
+                   WHERE tasks.status != 'running' OR tasks.lease_expires < ?""",
+                [(queue, task_id, func_ref, json.dumps(payload), now, position, now)
+                 for position, (task_id, payload) in enumerate(tasks)])
+
+        self._transaction(work)
+
+    def claim(self, queue, worker_id):
+        """
+        claim งานถัดไป (งาน queued หรืองาน running ที่ lease หมดแล้ว)
+        คืนค่า (task_id, func_ref, payload) หรือ None ถ้าไม่มีงาน
+        """
+        def work(conn):
+            now = time.time()
+            self._fail_exhausted(conn, queue, now)
+            row = conn.execute(
+                """SELECT task_id, func, payload FROM tasks
+                   WHERE queue = ? AND (status = 'queued' OR (status = 'running' AND lease_expires < ?))
+                   ORDER BY submitted_at, position LIMIT 1""",
+                (queue, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """UPDATE tasks SET status = 'running', worker = ?, attempts = attempts + 1,
+                       lease_expires = ?, started_at = ?
+                   WHERE queue = ? AND task_id = ?""",
+                (worker_id, now + self.lease_seconds, now, queue, row[0]))
+            return row[0], row[1], json.loads(row[2])
+
+        return self._transaction(work)
+
+    def _fail_exhausted(self, conn, queue, now):
+        """งานที่ lease หมดและ worker ตายซ้ำเกิน MAX_ATTEMPTS ครั้ง -> failed"""
+        conn.execute(
+            """UPDATE tasks SET status = 'failed', finished_at = ?,
+                   result = json_array(task_id, 'Failed - lease expired ' || attempts || ' times')
+               WHERE queue = ? AND status = 'running' AND lease_expires < ? AND attempts >= ?""",
+            (now, queue, now, self.max_attempts))
+
+    def expire_leases(self, queue):
+        """
+        จัดการงานที่ lease หมดโดยไม่ต้องรอ worker มา claim:
+        เกิน MAX_ATTEMPTS -> failed, ที่เหลือกลับเป็น queued
+        """
+        def work(conn):
+            now = time.time()
+            self._fail_exhausted(conn, queue, now)
+            conn.execute(
+                """UPDATE tasks SET status = 'queued', worker = NULL, lease_expires = NULL
+                   WHERE queue = ? AND status = 'running' AND lease_expires < ?""",
+                (queue, now))
+
+        self._transaction(work)
+
+    def release_worker(self, queue, worker_id):
+        """ทำให้ lease ของ worker ที่รู้แน่ว่าตายแล้วหมดทันที (ไม่ต้องรอ LEASE_SECONDS)"""
+        def work(conn):
+            conn.execute(
+                """UPDATE tasks SET lease_expires = 0
+                   WHERE queue = ? AND worker = ? AND status = 'running'""",
+                (queue, worker_id))
+
+        self._transaction(work)
+
+    def heartbeat(self, queue, task_id, worker_id):
+        """ต่อ lease ของงาน คืนค่า False ถ้างานไม่ได้เป็นของ worker นี้แล้ว"""
+        def work(conn):
+            cursor = conn.execute(
+                """UPDATE tasks SET lease_expires = ?
+                   WHERE queue = ? AND task_id = ? AND worker = ? AND status = 'running'""",
+                (time.time() + self.lease_seconds, queue, task_id, worker_id))
+            return cursor.rowcount == 1
+
+        return self._transaction(work)
+
+    def finish(self, queue, task_id, worker_id, status, result):
+        """บันทึกผลลัพธ์ (status = 'done' หรือ 'failed') ถ้า lease ยังเป็นของ worker นี้"""
+        def work(conn):
+            cursor = conn.execute(
+                """UPDATE tasks SET status = ?, result = ?, finished_at = ?, lease_expires = NULL
+                   WHERE queue = ? AND task_id = ? AND worker = ? AND status = 'running'""",
+                (status, json.dumps(result), time.time(), queue, task_id, worker_id))
+            return cursor.rowcount == 1
+
+        return self._transaction(work)
+
+    def counts(self, queue):
+        """จำนวนงานแยกตามสถานะ เช่น {'queued': 3, 'running': 2, 'done': 10}"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM tasks WHERE queue = ? GROUP BY status",
+                                (queue,)).fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+    def results(self, queue, task_ids):
+        """ผลลัพธ์ของงานตามลำดับ task_ids (None ถ้ายังไม่เสร็จ)"""
+        conn = self._connect()
+        try:
+            rows = dict(conn.execute("SELECT task_id, result FROM tasks WHERE queue = ?",
+                                     (queue,)).fetchall())
+        finally:
+            conn.close()
+        return [json.loads(rows[t]) if rows.get(t) is not None else None for t in task_ids]
+
+def _heartbeat_loop(work_queue, queue, task_id, worker_id, stop_event, interval):
+    """thread ที่ต่อ lease ระหว่างที่งานยังรันอยู่"""
+    while not stop_event.wait(interval):
+        try:
+            if not work_queue.heartbeat(queue, task_id, worker_id):
+                print(f"[{worker_id}] [WARNING] Lost lease on {task_id}.")
+                return
+        except sqlite3.Error as e:
+            print(f"[{worker_id}] [WARNING] Heartbeat failed for {task_id}: {e}")
+
+def run_worker(db_path, queue, exit_when_empty=False, lease_seconds=LEASE_SECONDS,
+               heartbeat_seconds=HEARTBEAT_SECONDS, poll_seconds=POLL_SECONDS):
+    """
+    loop ของ worker: claim งาน -> รันฟังก์ชัน -> บันทึกผล
+    exit_when_empty=True จะออกเมื่อไม่มีงาน queued/running เหลือในคิว
+    """
+    work_queue = WorkQueue(db_path, lease_seconds=lease_seconds)
+    worker_id = make_worker_id()
+    print(f"[{worker_id}] Worker started on queue '{queue}'.")
+
+    while True:
+        task = work_queue.claim(queue, worker_id)
+        if task is None:
+            counts = work_queue.counts(queue)
+            if exit_when_empty and counts.get('queued', 0) == 0 and counts.get('running', 0) == 0:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        task_id, func_ref, payload = task
+        print(f"[{worker_id}] Claimed {task_id}")
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat_loop,
+                                     args=(work_queue, queue, task_id, worker_id, stop_event, heartbeat_seconds),
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            result = resolve_func(func_ref)(payload)
+            status = 'done'
+        except Exception as e:
+            traceback.print_exc()
+            result = [task_id, f"Failed - {e}"]
+            status = 'failed'
+        finally:
+            stop_event.set()
+            heartbeat.join()
+        if not work_queue.finish(queue, task_id, worker_id, status, result):
+            print(f"[{worker_id}] [WARNING] Result for {task_id} discarded (lease was taken over).")
+
+    print(f"[{worker_id}] No tasks left. Worker exiting.")
+
+def map_on_queue(db_path, queue, func_ref, task_ids, tasks, local_workers=0,
+                 poll_seconds=POLL_SECONDS):
+    """
+    ใช้แทน pool.map: ส่งงานเข้าคิว, เปิด worker บนเครื่องนี้ local_workers ตัว (0 = ใช้แต่ worker เครื่องอื่น)
+    แล้วรอจนทุกงานเสร็จ คืนค่าผลลัพธ์ตามลำดับ tasks (tuple เหมือน pool.map)
+    ระหว่างรอจะคืนงานของ worker ที่ตาย (lease หมด / process บนเครื่องนี้ออกไปแล้ว) เข้าคิว
+    และเปิด worker บนเครื่องนี้แทนตัวที่ตาย จำนวนครั้งถูกจำกัดด้วย MAX_ATTEMPTS ของแต่ละงาน
+    """
+    work_queue = WorkQueue(db_path)
+    work_queue.submit(queue, func_ref, list(zip(task_ids, tasks)))
+    print(f"Submitted {len(tasks)} tasks to queue '{queue}' ({db_path}).")
+
+    def start_worker():
+        process = multiprocessing.Process(target=run_worker, args=(db_path, queue, True))
+        process.start()
+        return process
+
+    processes = [start_worker() for _ in range(local_workers)]
+    hostname = socket.gethostname()
+    warned_no_workers = False
+
+    while True:
+        for process in processes:
+            if process.is_alive():
+                continue
+            process.join()
+            if process.exitcode != 0:
+                print(f"[WARNING] Local worker {hostname}:{process.pid} exited with code {process.exitcode}.")
+                work_queue.release_worker(queue, f"{hostname}:{process.pid}")
+        work_queue.expire_leases(queue)
+
+        counts = work_queue.counts(queue)
+        queued, running = counts.get('queued', 0), counts.get('running', 0)
+        if queued == 0 and running == 0:
+            break
+        if queued > 0:
+            # worker ที่ออกไปแล้วแต่ยังมีงานในคิว (เช่น ถูก OOM kill) -> เปิดตัวใหม่แทน
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    processes[i] = start_worker()
+            if local_workers == 0 and running == 0 and not warned_no_workers:
+                print(f"[WARNING] {queued} tasks waiting in queue '{queue}' and no worker is running. "
+                      f"Start one with: python work_queue.py --db {db_path} --queue {queue}")
+                warned_no_workers = True
+        time.sleep(poll_seconds)
+
+    for process in processes:
+        process.join()
+
+    results = work_queue.results(queue, task_ids)
+    return [tuple(r) if isinstance(r, list) else r for r in results]
+
+def main():
+    """
+    รัน worker บนเครื่องใดก็ได้ที่ mount shared storage เดียวกัน เช่น
+    python work_queue.py --db /home_sbi_cold/.../work_queue.sqlite --queue genomics
+    (สำหรับ Transcriptomics ต้องรันจากโฟลเดอร์โปรเจกต์เดียวกับตัวส่งงาน เพราะใช้ os.getcwd())
+    """
+    parser = argparse.ArgumentParser(description="Shared-filesystem work queue worker")
+    parser.add_argument("--db", required=True, help="Path ของไฟล์ SQLite บน shared storage")
+    parser.add_argument("--queue", required=True, help="ชื่อคิว: genomics หรือ transcriptomics")
+    parser.add_argument("--exit-when-empty", action="store_true", help="ออกเมื่อคิวว่าง")
+    parser.add_argument("--lease", type=int, default=LEASE_SECONDS)
+    parser.add_argument("--heartbeat", type=int, default=HEARTBEAT_SECONDS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    run_worker(args.db, args.queue, args.exit_when_empty, args.lease, args.heartbeat)
+
+if __name__ == "__main__":
+    main()